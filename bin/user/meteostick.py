@@ -39,21 +39,46 @@ seems to result in higher quality readings.
 from __future__ import print_function  # Python 2/3 compatiblity
 from __future__ import with_statement
 
+import array
+import collections
+import glob
+import json
 import math
+import mmap
+import os
 import serial
+import signal
+import socket
+import sqlite3
 import string
+import struct
 import syslog
+import threading
 import time
 
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    import socketserver
+except ImportError:
+    # python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    import SocketServer as socketserver
+
 import weewx
 import weewx.drivers
 import weewx.engine
 import weewx.wxformulas
 import weewx.units
-from weewx.crc16 import crc16
+import weeutil.weeutil
+
+try:
+    # numpy is only needed for batch decoding of captured raw messages
+    import numpy
+except ImportError:
+    numpy = None
 
 DRIVER_NAME = 'Meteostick'
-DRIVER_VERSION = '0.61'
+DRIVER_VERSION = '0.62'
 
 DEBUG_SERIAL = 0
 DEBUG_RAIN = 0
@@ -62,6 +87,57 @@ DEBUG_RFS = 0
 
 MPH_TO_MPS = 1609.34 / 3600.0 # meter/mile * hour/second
 
+# unit groups of the observations of this driver that weewx does not know
+weewx.units.obs_group_dict.setdefault('windSpeed2', 'group_speed')
+weewx.units.obs_group_dict.setdefault('windDir2', 'group_direction')
+weewx.units.obs_group_dict.setdefault('windGust10', 'group_speed')
+weewx.units.obs_group_dict.setdefault('windGustDir10', 'group_direction')
+
+# monotonic clock for measuring intervals; python 2 only has time.time
+_monotonic = getattr(time, 'monotonic', time.time)
+
+
+class Clock(object):
+    """The time functions used by the driver and the station.
+
+    The default is the system clock.  Tests can pass a VirtualClock to run
+    hours of traffic through the retry, reset and statistics code in
+    seconds.  Stage timing and profiling always use the system clock.
+    """
+
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return _monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    """A clock that only advances when it sleeps or is advanced."""
+
+    def __init__(self, start=1500000000.0):
+        self.start = start
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now - self.start
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        if seconds > 0:
+            self.now += seconds
+
+
+SYSTEM_CLOCK = Clock()
+
 def loader(config_dict, engine):
     return MeteostickDriver(engine, config_dict)
 
@@ -103,13 +179,14 @@ except ImportError:
     def logerr(msg):
         logmsg(syslog.LOG_ERR, msg)
 
-def dbg_serial(verbosity, msg):
+# the debug message is only formatted with args when it will be logged
+def dbg_serial(verbosity, msg, args=None):
     if DEBUG_SERIAL >= verbosity:
-        logdbg(msg)
+        logdbg(msg if args is None else msg % args)
 
-def dbg_parse(verbosity, msg):
+def dbg_parse(verbosity, msg, args=None):
     if DEBUG_PARSE >= verbosity:
-        logdbg(msg)
+        logdbg(msg if args is None else msg % args)
 
 def _fmt(data):
     if not data:
@@ -142,17 +219,10 @@ def calculate_thermistor_temp(temp_raw):
     :param temp_raw: raw value from sensor for leaf wetness and soil moisture
     """
 
-    # Convert temp_raw to a resistance (R) in kiloOhms
-    a = 18.81099
-    b = 0.0009988027
-    r = a / (1.0 / temp_raw - b) / 1000 # k ohms
-
-    # Steinhart-Hart parameters
-    s1 = 0.002783573
-    s2 = 0.0002509406
+    r = _thermistor_resistance(temp_raw)
     try:
-        thermistor_temp = 1 / (s1 + s2 * math.log(r)) - 273
-        dbg_parse(3, 'r (k ohm) %s temp_raw %s thermistor_temp %s' %
+        thermistor_temp = _steinhart_hart(r)
+        dbg_parse(3, 'r (k ohm) %s temp_raw %s thermistor_temp %s',
                   (r, temp_raw, thermistor_temp))
         return thermistor_temp
     except ValueError as e:
@@ -161,6 +231,20 @@ def calculate_thermistor_temp(temp_raw):
     return DEFAULT_SOIL_TEMP
 
 
+def _thermistor_resistance(temp_raw):
+    # Convert temp_raw to a resistance (R) in kiloOhms
+    a = 18.81099
+    b = 0.0009988027
+    return a / (1.0 / temp_raw - b) / 1000 # k ohms
+
+
+def _steinhart_hart(r):
+    # Steinhart-Hart parameters
+    s1 = 0.002783573
+    s2 = 0.0002509406
+    return 1 / (s1 + s2 * math.log(r)) - 273
+
+
 def lookup_potential(sensor_name, norm_fact, sensor_raw, sensor_temp, lookup):
     """Look up potential based upon a normalized raw value (i.e. temp corrected
     for DEFAULT_SOIL_TEMP) and a linear function between two points in the
@@ -180,7 +264,7 @@ def lookup_potential(sensor_name, norm_fact, sensor_raw, sensor_temp, lookup):
     numcols = len(lookup[RAW])
     if sensor_raw_norm >= lookup[RAW][numcols - 1]:
         potential = lookup[POT][numcols - 1] # preset potential to last value
-        dbg_parse(3, "%s: temp=%s fact=%s raw=%s norm=%s potential=%s >= RAW=%s" %
+        dbg_parse(3, "%s: temp=%s fact=%s raw=%s norm=%s potential=%s >= RAW=%s",
                   (sensor_name, sensor_temp, norm_fact, sensor_raw,
                    sensor_raw_norm, potential, lookup[RAW][numcols - 1]))
     else:
@@ -190,7 +274,7 @@ def lookup_potential(sensor_name, norm_fact, sensor_raw, sensor_temp, lookup):
             if sensor_raw_norm < lookup[RAW][x]:
                 if x == 0:
                     # 'pre zero' phase; potential = first value
-                    dbg_parse(3, "%s: temp=%s fact=%s raw=%s norm=%s potential=%s < RAW=%s" %
+                    dbg_parse(3, "%s: temp=%s fact=%s raw=%s norm=%s potential=%s < RAW=%s",
                               (sensor_name, sensor_temp, norm_fact, sensor_raw,
                                sensor_raw_norm, potential, lookup[RAW][0]))
                     break
@@ -199,7 +283,7 @@ def lookup_potential(sensor_name, norm_fact, sensor_raw, sensor_temp, lookup):
                     potential_per_raw = (lookup[POT][x] - lookup[POT][x - 1]) / (lookup[RAW][x] - lookup[RAW][x - 1])
                     potential_offset = (sensor_raw_norm - lookup[RAW][x - 1]) * potential_per_raw
                     potential = lookup[POT][x - 1] + potential_offset
-                    dbg_parse(3, "%s: temp=%s fact=%s raw=%s norm=%s potential=%s RAW=%s to %s POT=%s to %s " %
+                    dbg_parse(3, "%s: temp=%s fact=%s raw=%s norm=%s potential=%s RAW=%s to %s POT=%s to %s ",
                               (sensor_name, sensor_temp, norm_fact, sensor_raw,
                                sensor_raw_norm, potential,
                                lookup[RAW][x - 1], lookup[RAW][x],
@@ -208,9 +292,1780 @@ def lookup_potential(sensor_name, norm_fact, sensor_raw, sensor_temp, lookup):
     return potential
 
 
+# Fields of the structured array returned by Meteostick.parse_raw_batch.  The
+# names match the keys of the dict returned by Meteostick.parse_raw, except
+# for the numbered leaf/soil observations, which are reported in the generic
+# soil_temp, soil_moisture, leaf_temp and leaf_wetness fields together with
+# the sensor_num.  Observations that parse_raw would not report are NaN.
+BATCH_FIELDS = [
+    ('crc_ok', 'bool'),
+    ('channel', 'u1'),
+    ('message_type', 'u1'),
+    ('battery', 'u1'),
+    ('rf_signal', 'i4'),
+    ('rf_missed', 'i8'),
+    ('sensor_num', 'u1'),
+    ('bat_iss', 'f8'),
+    ('bat_anemometer', 'f8'),
+    ('bat_leaf_soil', 'f8'),
+    ('bat_th_1', 'f8'),
+    ('bat_th_2', 'f8'),
+    ('wind_speed_raw', 'f8'),
+    ('wind_speed_ec', 'f8'),
+    ('wind_speed', 'f8'),
+    ('wind_dir', 'f8'),
+    ('supercap_volt', 'f8'),
+    ('uv', 'f8'),
+    ('rain_rate', 'f8'),
+    ('solar_radiation', 'f8'),
+    ('solar_power', 'f8'),
+    ('temperature', 'f8'),
+    ('temp_1', 'f8'),
+    ('temp_2', 'f8'),
+    ('temp_3', 'f8'),
+    ('humidity', 'f8'),
+    ('humid_1', 'f8'),
+    ('humid_2', 'f8'),
+    ('rain_count', 'f8'),
+    ('soil_temp', 'f8'),
+    ('soil_moisture', 'f8'),
+    ('leaf_temp', 'f8'),
+    ('leaf_wetness', 'f8')]
+
+_batch_tables = None
+
+
+def _get_batch_tables():
+    """Build the lookup tables used by the batch decoder.  Every table entry
+    is calculated with the same scalar code that parse_raw uses, so that the
+    batch results are identical to the per-message results."""
+    global _batch_tables
+    if _batch_tables is not None:
+        return _batch_tables
+    nan = float('nan')
+
+    # wind speed error correction by raw speed and raw direction
+    wind_ec = numpy.zeros((256, 256), dtype=numpy.int64)
+    for speed in range(256):
+        for angle in range(256):
+            wind_ec[speed, angle] = round(
+                Meteostick.calc_wind_speed_ec(speed, angle))
+
+    # wind direction (Vantage Pro and Pro2 formula) by raw direction
+    wind_dir = numpy.zeros(256, dtype=numpy.float64)
+    for raw in range(256):
+        if raw == 0:
+            wind_dir[raw] = 5.0
+        elif raw == 255:
+            wind_dir[raw] = 355.0
+        else:
+            wind_dir[raw] = 9.0 + (raw - 1) * 342.0 / 253.0
+
+    # digital outside temperature by 12-bit raw value (twos-complement)
+    temp_digital = numpy.zeros(4096, dtype=numpy.float64)
+    for raw in range(4096):
+        if raw & 0x800:
+            temp_f = -(raw ^ 0xFFF) / 10.0
+        else:
+            temp_f = raw / 10.0
+        temp_digital[raw] = weewx.wxformulas.FtoC(temp_f)
+
+    # thermistor temperature by raw value in steps of 1/4
+    thermistor = numpy.zeros(4096, dtype=numpy.float64)
+    for raw in range(4096):
+        try:
+            r = _thermistor_resistance(raw / 4.0)
+        except ZeroDivisionError:
+            thermistor[raw] = nan
+            continue
+        try:
+            thermistor[raw] = _steinhart_hart(r)
+        except ValueError:
+            thermistor[raw] = DEFAULT_SOIL_TEMP
+
+    # humidity by 12-bit raw value for analog (0) and digital (1) sensors
+    humidity = numpy.zeros((2, 4096), dtype=numpy.float64)
+    for raw in range(4096):
+        humidity[0, raw] = raw * -0.301 + 710.23
+        humidity[1, raw] = raw / 10.0
+
+    _batch_tables = {
+        'crc': numpy.array(CRC16_TABLE, dtype=numpy.uint16),
+        'wind_ec': wind_ec,
+        'wind_dir': wind_dir,
+        'temp_digital': temp_digital,
+        'thermistor': thermistor,
+        'humidity': humidity,
+        'sm_raw': numpy.array(SM_MAP[RAW]),
+        'sm_pot': numpy.array(SM_MAP[POT]),
+        'lw_raw': numpy.array(LW_MAP[RAW]),
+        'lw_pot': numpy.array(LW_MAP[POT])}
+    return _batch_tables
+
+
+def _batch_crc16(table, columns):
+    crc = numpy.zeros(len(columns[0]), dtype=numpy.uint16)
+    for col in columns:
+        crc = (crc << 8) ^ table[(crc >> 8) ^ col]
+    return crc
+
+
+def _batch_lookup_potential(norm_fact, sensor_raw, sensor_temp, lookup_raw,
+                            lookup_pot):
+    """Vectorised version of lookup_potential."""
+    sensor_raw_norm = sensor_raw * (1 + norm_fact * (sensor_temp - DEFAULT_SOIL_TEMP))
+    numcols = len(lookup_raw)
+    x = numpy.searchsorted(lookup_raw, sensor_raw_norm, side='right')
+    x0 = numpy.clip(x - 1, 0, numcols - 1)
+    x1 = numpy.clip(x, 0, numcols - 1)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        potential_per_raw = (lookup_pot[x1] - lookup_pot[x0]) / (lookup_raw[x1] - lookup_raw[x0])
+        potential_offset = (sensor_raw_norm - lookup_raw[x0]) * potential_per_raw
+        potential = lookup_pot[x0] + potential_offset
+    potential = numpy.where(x == 0, lookup_pot[0], potential)
+    potential = numpy.where(x >= numcols, lookup_pot[numcols - 1], potential)
+    return numpy.where(numpy.isnan(sensor_raw_norm), numpy.nan, potential)
+
+
+class Units(object):
+    """Conversion of the decoded values to the units of a weewx unit system.
+
+    The transmitters measure wind in mph and digital temperatures in 0.1 F,
+    so those are converted from the raw integers with a factor and a table
+    for the target units.  Values that are calculated in metric units
+    (thermistor temperatures, pressure, rain) use a factor and offset that
+    are derived once from the weewx conversions.
+    """
+
+    def __init__(self, unit_system=weewx.METRICWX):
+        self.unit_system = unit_system
+        units = weewx.units.std_groups[unit_system]
+        self.rain_unit = units['group_rain']
+        self.temp_a, self.temp_b = self._linear('group_temperature', units)
+        self.pressure_a, self.pressure_b = self._linear('group_pressure',
+                                                        units)
+        self.rain_a, self.rain_b = self._linear('group_rain', units)
+        speed_unit = units['group_speed']
+        if speed_unit == 'mile_per_hour':
+            self.mph = 1.0
+        elif speed_unit == 'meter_per_second':
+            self.mph = MPH_TO_MPS
+        else:
+            self.mph = weewx.units.conversionDict['mile_per_hour'][speed_unit](1.0)
+        # digital temperature by the 12-bit raw value (twos-complement 0.1 F)
+        self.temp_f = []
+        for temp_raw in range(0x1000):
+            if temp_raw & 0x800:
+                temp_f = -(temp_raw ^ 0xFFF) / 10.0
+            else:
+                temp_f = temp_raw / 10.0
+            if units['group_temperature'] == 'degree_F':
+                self.temp_f.append(temp_f)
+            else:
+                self.temp_f.append(self.temp(weewx.wxformulas.FtoC(temp_f)))
+
+    @staticmethod
+    def _linear(group, units):
+        # the weewx conversions between these units are all linear
+        from_unit = weewx.units.MetricWXUnits[group]
+        to_unit = units[group]
+        if from_unit == to_unit:
+            return 1.0, 0.0
+        func = weewx.units.conversionDict[from_unit][to_unit]
+        b = func(0.0)
+        return (func(100.0) - b) / 100.0, b
+
+    def temp(self, temp_c):
+        return temp_c * self.temp_a + self.temp_b
+
+    def pressure(self, hpa):
+        return hpa * self.pressure_a + self.pressure_b
+
+    def rain(self, mm):
+        return mm * self.rain_a + self.rain_b
+
+    def rain_per_tip(self, bucket_type):
+        """The rain per tip of a rain bucket type in the target units."""
+        if bucket_type == 0 and self.rain_unit == 'inch':
+            return 0.01
+        return self.rain(0.254 if bucket_type == 0 else 0.2)
+
+
+METRICWX_UNITS = Units(weewx.METRICWX)
+
+
 RAW_CHANNEL = 0  # unused channel for the receiver stats in raw format
 
 
+def _crc16_table():
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table.append(crc & 0xFFFF)
+    return table
+
+# crc16 (CCITT) table, the same as used by weewx.crc16
+CRC16_TABLE = _crc16_table()
+
+CRC_DAVIS = (0, 1, 2, 3, 4, 5, 6, 7)  # crc over bytes 0-7 must be 0
+CRC_REPEATER = (0, 1, 2, 3, 4, 5, 8, 9)  # crc over bytes 0-5, 8-9 is bytes 6-7
+
+
+class CRCError(ValueError):
+    """A raw message with a bad crc."""
+
+
+class Frame(object):
+    """A raw Davis message as received in the 10-byte raw format.
+
+    A frame is meant to be reused for consecutive messages: load() decodes
+    the hex bytes of a message into the existing buffer, so that decoding a
+    message does not allocate temporary lists.
+    """
+    __slots__ = ('pkt', 'channel', 'battery_low', 'message_type',
+                 'rf_signal', 'time_since_last', 'skipped')
+
+    def __init__(self):
+        self.pkt = bytearray(10)
+        self.skipped = None # 'channel' or 'message' when not decoded
+        self.channel = 0
+        self.battery_low = 0
+        self.message_type = 0
+        self.rf_signal = 0
+        self.time_since_last = 0
+
+    def load(self, parts):
+        # message example:
+        #       ---- raw message ----  rfs ts_last
+        # I 101 81 5 C9 FF 83 0 73 AC FF FF  -68 2624988 161
+        if len(parts) < 15:
+            raise ValueError("not enough parts (%s) in raw message" % len(parts))
+        pkt = self.pkt
+        for i in range(10):
+            pkt[i] = int(parts[i + 2], 16)
+        self.channel = (pkt[0] & 0x7) + 1
+        self.battery_low = (pkt[0] >> 3) & 0x1
+        self.message_type = pkt[0] >> 4
+        self.rf_signal = int(parts[13])
+        self.time_since_last = int(parts[14])
+
+    def check_crc(self):
+        pkt = self.pkt
+        if pkt[8] == 0xFF and pkt[9] == 0xFF:
+            # message received from davis equipment
+            # Calculate crc with bytes 0-7, result must be equal to 0
+            chksum = 0
+            idx = CRC_DAVIS
+        else:
+            # message received via repeater
+            # Calculate crc with bytes 0-5 and 8-9, result must be equal
+            # to bytes 6-7
+            chksum = (pkt[6] << 8) + pkt[7]
+            idx = CRC_REPEATER
+        crc = 0
+        for i in idx:
+            crc = (CRC16_TABLE[(crc >> 8) ^ pkt[i]] ^ (crc << 8)) & 0xFFFF
+        if crc != chksum:
+            logerr('CRC result is 0x%04x, should be 0x%04x' % (crc, chksum))
+            raise CRCError("CRC error")
+
+
+class Reading(object):
+    """A line from the meteostick on its way through the stages of the
+    read loop.  raw is the line, data is what was decoded from it, packet
+    is the loop packet of the data and packets are the loop packets that
+    are due after the line; coalescing can hold back or merge packets.
+    """
+    __slots__ = ('raw', 'data', 'packet', 'packets')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.data = dict()
+        self.packet = None
+        self.packets = []
+
+
+class Transmitter(object):
+    """A Davis transmitter on one of the eight channels.
+
+    The kind tells how the messages of the transmitter are decoded, the
+    names tell which fields of the data the decoded values go to.  The
+    named transmitters (iss, anemometer, temp_hum_1, temp_hum_2 and
+    leaf_soil) use the traditional field names, additional transmitters
+    get the channel as suffix, e.g. temp_ch3 or soil_moisture_1_ch5.
+    """
+    __slots__ = ('channel', 'kind', 'label', 'battery', 'temp', 'humid',
+                 'suffix', 'skip')
+    WIND_FIELDS = ('wind_speed', 'wind_dir', 'wind_speed_ec', 'wind_speed_raw')
+
+    def __init__(self, channel, kind, label, battery, temp=None, humid=None,
+                 suffix=''):
+        self.channel = channel
+        self.kind = kind
+        self.label = label
+        self.battery = battery
+        self.temp = temp
+        self.humid = humid
+        self.suffix = suffix
+        self.skip = frozenset() # message types that need not be decoded
+
+    def set_needed(self, needed):
+        """Skip the decoding of the messages of which no field is in
+        needed.  With needed None all messages are decoded."""
+        skip = set()
+        if needed is not None:
+            if self.kind == 'leaf_soil':
+                for subtype, names in [(1, ('soil_temp', 'soil_moisture')),
+                                       (2, ('leaf_temp', 'leaf_wetness'))]:
+                    if not any('%s_%s%s' % (name, num, self.suffix) in needed
+                               for name in names for num in range(1, 5)):
+                        skip.add(subtype)
+            else:
+                if not any(f in needed for f in self.WIND_FIELDS):
+                    skip.add('wind')
+                fields = {2: 'supercap_volt',
+                          4: 'uv',
+                          5: 'rain_rate' if self.kind == 'iss' else None,
+                          6: 'solar_radiation',
+                          7: 'solar_power',
+                          8: self.temp,
+                          9: 'wind_gust_10_tx',
+                          0xA: self.humid,
+                          0xE: 'rain_count'}
+                for message_type in fields:
+                    if fields[message_type] not in needed:
+                        skip.add(message_type)
+        self.skip = frozenset(skip)
+
+    @staticmethod
+    def extra(channel, kind):
+        if kind == 'temp_hum':
+            return Transmitter(channel, kind, 'temp_hum_ch%s' % channel,
+                               'bat_ch%s' % channel, 'temp_ch%s' % channel,
+                               'humid_ch%s' % channel)
+        if kind == 'leaf_soil':
+            return Transmitter(channel, kind, 'leaf_soil_ch%s' % channel,
+                               'bat_ch%s' % channel,
+                               suffix='_ch%s' % channel)
+        raise ValueError("invalid transmitter type %s for channel %s" %
+                         (kind, channel))
+
+
+def make_registry(channels, extra=None):
+    """Return a list that maps each channel to its Transmitter, or to None
+    for channels without a transmitter.  channels are the channels of the
+    named transmitters, extra maps additional channels to their type
+    (temp_hum or leaf_soil)."""
+    registry = [None] * 9  # indexed by channel, RAW_CHANNEL stays unused
+    # when channels are shared the first one listed here wins
+    for tx in [Transmitter(channels['iss'], 'iss', 'iss', 'bat_iss',
+                           'temperature', 'humidity'),
+               Transmitter(channels['anemometer'], 'anemometer', 'wind',
+                           'bat_anemometer', 'temp_3'),
+               Transmitter(channels['temp_hum_1'], 'temp_hum', 'temp_hum_1',
+                           'bat_th_1', 'temp_1', 'humid_1'),
+               Transmitter(channels['temp_hum_2'], 'temp_hum', 'temp_hum_2',
+                           'bat_th_2', 'temp_2', 'humid_2'),
+               Transmitter(channels['leaf_soil'], 'leaf_soil', 'leaf_soil',
+                           'bat_leaf_soil')]:
+        if tx.channel != 0 and registry[tx.channel] is None:
+            registry[tx.channel] = tx
+    for ch, kind in sorted((extra or {}).items()):
+        if not 1 <= ch <= 8:
+            raise ValueError("invalid channel %s for transmitter %s" %
+                             (ch, kind))
+        if registry[ch] is not None:
+            raise ValueError("channel %s is already used by %s" %
+                             (ch, registry[ch].label))
+        registry[ch] = Transmitter.extra(ch, kind)
+    return registry
+
+
+class PacketCoalescer(object):
+    """Merge the loop packets of consecutive frames into a single packet.
+
+    Each raw message carries only one or two observations.  The coalescer
+    collects the packets of a window and emits them as one packet, which
+    reduces the number of packets that weewx services have to process.
+    Within a window the latest value of an observation wins, except for
+    rain, which is summed.
+
+    A merged packet is emitted when it has min_fields observations, or when
+    the first packet of the window is max_latency seconds old.
+    """
+
+    def __init__(self, max_latency, min_fields=0):
+        self.max_latency = max_latency
+        self.min_fields = min_fields
+        self.pending = None
+        self.start_ts = None
+
+    def add(self, packet, now):
+        """Merge a packet.  Returns the merged packet when it is complete,
+        otherwise None."""
+        if self.pending is None:
+            self.pending = dict(packet)
+            self.start_ts = now
+        else:
+            pending = self.pending
+            for k in packet:
+                if k == 'rain' and pending.get('rain') is not None:
+                    if packet['rain'] is not None:
+                        pending['rain'] += packet['rain']
+                else:
+                    pending[k] = packet[k]
+        if self.min_fields and len(self.pending) - 2 >= self.min_fields:
+            return self.flush()
+        return self.expire(now)
+
+    def expire(self, now):
+        """Returns the merged packet if it exceeded the latency, otherwise
+        None."""
+        if self.pending is not None and now - self.start_ts >= self.max_latency:
+            return self.flush()
+        return None
+
+    def flush(self):
+        packet = self.pending
+        self.pending = None
+        self.start_ts = None
+        return packet
+
+
+class Deadband(object):
+    """Suppress observations that did not change since they were emitted.
+
+    A field with a deadband is only emitted when it differs more than the
+    deadband from the last emitted value, or when it was not emitted for
+    its refresh interval.  The refresh interval keeps every field present
+    in each archive interval, so it should be shorter than the archive
+    interval.
+    """
+    DEFAULT_REFRESH_INTERVAL = 60 # seconds
+
+    def __init__(self, deadband, refresh_interval):
+        self.deadband = dict((k, float(deadband[k])) for k in deadband)
+        self.refresh_interval = dict()
+        for k in set(self.deadband) | set(refresh_interval):
+            self.deadband.setdefault(k, 0.0)
+            self.refresh_interval[k] = float(
+                refresh_interval.get(k, self.DEFAULT_REFRESH_INTERVAL))
+        for k in ('dateTime', 'usUnits', 'rain'):
+            self.deadband.pop(k, None)
+        self.last_value = dict()
+        self.last_ts = dict()
+        self.suppressed = dict((k, 0) for k in self.deadband)
+        self.suppressed_count = 0
+
+    def apply(self, packet, now):
+        """Remove the fields from packet that need not be emitted."""
+        for k in self.deadband:
+            if k not in packet:
+                continue
+            value = packet[k]
+            last = self.last_value.get(k)
+            if value is not None and last is not None \
+                    and abs(value - last) <= self.deadband[k] \
+                    and now - self.last_ts[k] < self.refresh_interval[k]:
+                del packet[k]
+                self.suppressed[k] += 1
+                self.suppressed_count += 1
+            else:
+                self.last_value[k] = value
+                self.last_ts[k] = now
+
+
+class CurrentConditions(object):
+    """The latest value of each field of the loop packets.
+
+    Each field keeps its value, the (monotonic) time it arrived and the
+    channel of the transmitter it came from.  A field that was not updated
+    within its maximum age is stale and is pruned, so the values of a
+    transmitter that stopped sending are not repeated.
+    """
+    DEFAULT_MAX_AGE = 900 # seconds
+
+    def __init__(self, max_age):
+        self.max_age = dict((k, float(max_age[k])) for k in max_age)
+        self.values = dict() # field: (value, arrival, channel)
+
+    def update(self, packet, arrival, channel):
+        for k in packet:
+            # rain is a delta, not a condition
+            if k not in ('dateTime', 'usUnits', 'rain'):
+                self.values[k] = (packet[k], arrival, channel)
+
+    def prune(self, now):
+        """Remove the stale fields.  Returns their names."""
+        stale = [k for k, v in list(self.values.items())
+                 if now - v[1] > self.max_age.get(k, self.DEFAULT_MAX_AGE)]
+        for k in stale:
+            self.values.pop(k, None)
+        return stale
+
+    def get(self, now):
+        """Dict of field to its value, age in seconds and channel."""
+        self.prune(now)
+        return dict((k, {'value': v[0], 'age': now - v[1], 'channel': v[2]})
+                    for k, v in list(self.values.items()))
+
+    def merge(self, packet, now):
+        """Add the fields that are not in packet with their latest value."""
+        for k in self.prune(now):
+            dbg_parse(2, "pruned stale field %s", k)
+        for k, v in list(self.values.items()):
+            if k not in packet:
+                packet[k] = v[0]
+
+
+class ArchiveAccumulator(object):
+    """Running aggregates of loop packets for one archive interval.
+
+    Each field keeps a sum and a count, directions keep the sums of their
+    unit vectors, wind keeps a vector sum and rain is summed, so a packet
+    is added in constant time.  When a packet arrives for the next archive
+    interval, the record of the current interval is completed: averages
+    for the fields, vector averages for the directions, the wind direction
+    weighted with the wind speed, the maximum wind speed as gust, the sum of rain and
+    the last battery status.
+    """
+    MAX_RECORDS = 100
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.records = collections.deque(maxlen=self.MAX_RECORDS)
+        self.end_ts = None
+        self.unit_system = weewx.METRICWX
+        self._reset()
+
+    def _reset(self):
+        self.sum = dict()
+        self.cnt = dict()
+        self.dir_x = dict()
+        self.dir_y = dict()
+        self.last = dict()
+        self.wind_x = 0.0
+        self.wind_y = 0.0
+        self.wind_cnt = 0
+        self.gust = None
+        self.gust_dir = None
+        self.rain = None
+
+    def add(self, packet):
+        """Add a loop packet.  Returns the completed record when the packet
+        starts a new archive interval, otherwise None."""
+        ts = packet['dateTime']
+        self.unit_system = packet.get('usUnits', self.unit_system)
+        record = None
+        if self.end_ts is not None and ts > self.end_ts:
+            record = self.close(ts)
+        if self.end_ts is None:
+            self.end_ts = -(-ts // self.interval) * self.interval
+        for k in packet:
+            value = packet[k]
+            if value is None or k in ('dateTime', 'usUnits'):
+                continue
+            if k == 'rain':
+                self.rain = value if self.rain is None else self.rain + value
+            elif k.endswith('BatteryStatus'):
+                self.last[k] = value
+            elif k in self.sum:
+                self.sum[k] += value
+                self.cnt[k] += 1
+            elif k in self.dir_x:
+                self.dir_x[k] += math.sin(math.radians(value))
+                self.dir_y[k] += math.cos(math.radians(value))
+            elif weewx.units.obs_group_dict.get(k) == 'group_direction':
+                # an arithmetic mean of 350 and 10 degrees would be 180
+                self.dir_x[k] = math.sin(math.radians(value))
+                self.dir_y[k] = math.cos(math.radians(value))
+            else:
+                self.sum[k] = value
+                self.cnt[k] = 1
+        speed = packet.get('windSpeed')
+        direction = packet.get('windDir')
+        if speed is not None and direction is not None:
+            self.wind_x += speed * math.sin(math.radians(direction))
+            self.wind_y += speed * math.cos(math.radians(direction))
+            self.wind_cnt += 1
+            if self.gust is None or speed > self.gust:
+                self.gust = speed
+                self.gust_dir = direction
+        return record
+
+    def close(self, now):
+        """Complete the record of the current interval if it ended before
+        now.  Returns the record, or None."""
+        if self.end_ts is None or now <= self.end_ts:
+            return None
+        record = {'dateTime': self.end_ts,
+                  'usUnits': self.unit_system,
+                  'interval': self.interval // 60}
+        for k in self.sum:
+            record[k] = self.sum[k] / self.cnt[k]
+        for k in self.dir_x:
+            if self.dir_x[k] != 0 or self.dir_y[k] != 0:
+                record[k] = math.degrees(
+                    math.atan2(self.dir_x[k], self.dir_y[k])) % 360.0
+            else:
+                record[k] = None
+        record.update(self.last)
+        if self.wind_cnt:
+            if self.wind_x != 0 or self.wind_y != 0:
+                record['windDir'] = math.degrees(
+                    math.atan2(self.wind_x, self.wind_y)) % 360.0
+            else:
+                record['windDir'] = None
+            record['windGust'] = self.gust
+            record['windGustDir'] = self.gust_dir
+        record['rain'] = self.rain
+        self.records.append(record)
+        self.end_ts = None
+        self._reset()
+        return record
+
+    def get_records(self, since_ts):
+        for record in self.records:
+            if since_ts is None or record['dateTime'] > since_ts:
+                yield record
+
+
+class RFStatistics(object):
+    """Reception statistics per channel that are never flushed.
+
+    Received and missed counts are kept in one-minute buckets of a ring
+    that covers the longest window, so the pct-good over the last minutes
+    can be queried at any time.  The rf signal is kept in a histogram with
+    a bin per dB, from which percentiles are calculated.  All counters are
+    arrays indexed by channel, so an update takes constant time.
+    """
+    BUCKET = 60 # seconds
+    NUM_BUCKETS = 15 # longest window is 15 minutes
+    MIN_SIGNAL = -125 # dB
+    NUM_BINS = 126 # -125 to 0 dB
+
+    def __init__(self, num_chan):
+        self.num_chan = num_chan
+        n = num_chan * self.NUM_BUCKETS
+        self.bucket_ts = array.array('l', [-1] * n)
+        self.bucket_cnt = array.array('l', [0] * n)
+        self.bucket_missed = array.array('l', [0] * n)
+        self.hist = array.array('l', [0] * (num_chan * self.NUM_BINS))
+        self.cnt = array.array('l', [0] * num_chan)
+
+    def update(self, ch, signal, missed, now):
+        minute = int(now // self.BUCKET)
+        idx = ch * self.NUM_BUCKETS + minute % self.NUM_BUCKETS
+        if self.bucket_ts[idx] != minute:
+            self.bucket_ts[idx] = minute
+            self.bucket_cnt[idx] = 0
+            self.bucket_missed[idx] = 0
+        self.bucket_cnt[idx] += 1
+        if missed > 0:
+            self.bucket_missed[idx] += missed
+        b = min(max(signal - self.MIN_SIGNAL, 0), self.NUM_BINS - 1)
+        self.hist[ch * self.NUM_BINS + b] += 1
+        self.cnt[ch] += 1
+
+    def pct_good(self, ch, minutes, now):
+        """Percentage of received packets over the last minutes, including
+        the current minute.  None if nothing was received."""
+        minutes = min(minutes, self.NUM_BUCKETS)
+        last = int(now // self.BUCKET)
+        cnt = missed = 0
+        for minute in range(last - minutes + 1, last + 1):
+            idx = ch * self.NUM_BUCKETS + minute % self.NUM_BUCKETS
+            if self.bucket_ts[idx] == minute:
+                cnt += self.bucket_cnt[idx]
+                missed += self.bucket_missed[idx]
+        if cnt == 0:
+            return None
+        return 100.0 * cnt / (cnt + missed)
+
+    def percentile(self, ch, pct):
+        """The rf signal in dB at or below which pct percent of the packets
+        of a channel were received.  None if nothing was received."""
+        total = self.cnt[ch]
+        if total == 0:
+            return None
+        target = pct / 100.0 * total
+        n = 0
+        base = ch * self.NUM_BINS
+        for b in range(self.NUM_BINS):
+            n += self.hist[base + b]
+            if n > 0 and n >= target:
+                return b + self.MIN_SIGNAL
+        return self.MIN_SIGNAL + self.NUM_BINS - 1
+
+    def histogram(self, ch):
+        """Dict of rf signal in dB to the number of packets received."""
+        base = ch * self.NUM_BINS
+        return dict((b + self.MIN_SIGNAL, self.hist[base + b])
+                    for b in range(self.NUM_BINS) if self.hist[base + b])
+
+
+class ArrivalScheduler(object):
+    """Predict when the next message of each transmitter will arrive.
+
+    A Davis transmitter with id 0-7 (channel 1-8) transmits every
+    (41 + id) / 16 seconds, so after each message the arrival of the next
+    one is known.  A message that did not arrive within the tolerance of
+    its predicted time is counted as missed right away, and the deviation
+    of the arrivals from the transmit period is tracked as jitter.
+    """
+    TOLERANCE = 0.5 # seconds
+    MIN_TIMEOUT = 0.1 # seconds
+
+    def __init__(self, channels):
+        self.period = dict((ch, (41 + ch - 1) / 16.0) for ch in channels)
+        self.last = dict()
+        self.expected = dict()
+        self.missed = dict((ch, 0) for ch in channels)
+        self.jitter = dict((ch, 0.0) for ch in channels)
+
+    def arrival(self, ch, now):
+        if ch not in self.period:
+            return
+        period = self.period[ch]
+        if ch in self.last:
+            elapsed = now - self.last[ch]
+            n = max(1, int(elapsed / period + 0.5))
+            deviation = abs(elapsed - n * period)
+            self.jitter[ch] += (deviation - self.jitter[ch]) / 16.0
+        self.last[ch] = now
+        self.expected[ch] = now + period
+
+    def check(self, now):
+        """Count the messages that are overdue.  Returns the channels of
+        the missed messages."""
+        missed = []
+        for ch in self.expected:
+            while now > self.expected[ch] + self.TOLERANCE:
+                self.expected[ch] += self.period[ch]
+                self.missed[ch] += 1
+                missed.append(ch)
+        return missed
+
+    def next_timeout(self, now, max_timeout):
+        """Seconds to wait for the next message that is due."""
+        if not self.expected:
+            return max_timeout
+        due = min(self.expected.values()) + self.TOLERANCE - now
+        return min(max(due, self.MIN_TIMEOUT), max_timeout)
+
+
+class RFTuner(object):
+    """Adjust the rf sensitivity to the reception, one step per window.
+
+    Over each window the valid frames, the missed frames and the weakest
+    signal of each channel are counted, and the frames with a crc error.
+    When more than max_crc_rate of the frames have a crc error the
+    sensitivity is lowered, but not so far that the weakest signal that
+    was received drops below the threshold.  When a channel missed frames
+    and its weakest signal is close to the threshold the sensitivity is
+    raised.  A raise that did not bring more valid frames per hour is
+    undone, and no raise is tried for the next HOLD windows.  The
+    sensitivity stays between minimum and maximum.
+    """
+    STEP = 2 # dB
+    MARGIN = 3 # dB between the weakest signal and the threshold
+    MIN_FRAMES = 20 # frames needed to judge a window
+    HOLD = 6 # windows
+
+    def __init__(self, minimum, maximum, interval=600, max_crc_rate=0.05):
+        if not 0 <= minimum <= maximum:
+            raise ValueError("invalid rf sensitivity bounds %s-%s" %
+                             (minimum, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.interval = interval
+        self.max_crc_rate = max_crc_rate
+        self.raised = None # sensitivity and valid frames per hour before a raise
+        self.hold = 0
+        self.changes = 0
+        self._reset(None, 0)
+
+    def _reset(self, now, crc_errors):
+        self.start = now
+        self.crc_errors = crc_errors
+        self.cnt = dict()
+        self.missed = dict()
+        self.min = dict()
+
+    def update(self, ch, signal, missed):
+        self.cnt[ch] = self.cnt.get(ch, 0) + 1
+        if missed > 0:
+            self.missed[ch] = self.missed.get(ch, 0) + missed
+        if signal < self.min.get(ch, 0):
+            self.min[ch] = signal
+
+    def step(self, now, rfs, crc_errors):
+        """Returns the new rf sensitivity at the end of a window, or None
+        to keep rfs.  crc_errors is the running count of crc errors."""
+        if self.start is None:
+            self._reset(now, crc_errors)
+            return None
+        elapsed = now - self.start
+        if elapsed < self.interval:
+            return None
+        valid = sum(self.cnt.values())
+        crc = crc_errors - self.crc_errors
+        if valid + crc < self.MIN_FRAMES:
+            self._reset(now, crc_errors)
+            return None
+        rate = 3600.0 * valid / elapsed
+        crc_rate = float(crc) / (valid + crc)
+        floor = max([-s for s in self.min.values()] or [0]) + self.MARGIN
+        weak = [ch for ch in sorted(self.missed)
+                if -self.min.get(ch, 0) >= rfs - self.MARGIN]
+        holding = self.hold > 0
+        if holding:
+            self.hold -= 1
+        new = None
+        if self.raised is not None:
+            old, old_rate = self.raised
+            self.raised = None
+            if rate <= old_rate:
+                new = old
+                self.hold = self.HOLD
+                reason = "%d valid frames/h, was %d" % (rate, old_rate)
+        if new is None:
+            if crc_rate > self.max_crc_rate and rfs - self.STEP >= floor:
+                new = rfs - self.STEP
+                reason = "crc errors %.1f%%" % (100.0 * crc_rate)
+            elif weak and crc_rate <= self.max_crc_rate and not holding:
+                new = rfs + self.STEP
+                self.raised = (rfs, rate)
+                reason = "missed frames on channel %s" % weak
+        self._reset(now, crc_errors)
+        if new is None:
+            return None
+        new = min(max(new, self.minimum), self.maximum)
+        if new == rfs:
+            self.raised = None
+            return None
+        self.changes += 1
+        loginf("rf tuner: rf_sensitivity %s -> %s (%s)" % (rfs, new, reason))
+        return new
+
+
+class WindStatistics(object):
+    """Rolling wind gust and wind averages, updated with each wind sample.
+
+    The gust is the maximum of a window kept in a monotonic deque, the
+    averages are running sums of the speed and of the wind vector over
+    2 and 10 minutes, so each sample takes constant time however many
+    samples the windows hold.  The gust is cross-checked against the
+    10-minute gust that the transmitter itself reports.
+    """
+    GUST_WINDOW = 600 # seconds
+    WINDOWS = (120, 600) # seconds
+    GUST_TOLERANCE = 2 # mph
+
+    def __init__(self, mph=MPH_TO_MPS):
+        self.tolerance = self.GUST_TOLERANCE * mph # in the units of the speeds
+        self.gusts = collections.deque() # (time, speed, dir), speed decreasing
+        self.samples = dict((w, collections.deque()) for w in self.WINDOWS)
+        self.sums = dict((w, [0.0, 0.0, 0.0]) for w in self.WINDOWS)
+        self.first = None
+        self.mismatches = 0
+
+    def add(self, now, speed, direction):
+        if self.first is None:
+            self.first = now
+        gusts = self.gusts
+        while gusts and gusts[-1][1] <= speed:
+            gusts.pop()
+        gusts.append((now, speed, direction))
+        rad = math.radians(direction)
+        sample = (now, speed, speed * math.sin(rad), speed * math.cos(rad))
+        for w in self.WINDOWS:
+            self.samples[w].append(sample)
+            s = self.sums[w]
+            s[0] += sample[1]
+            s[1] += sample[2]
+            s[2] += sample[3]
+        self.expire(now)
+
+    def expire(self, now):
+        gusts = self.gusts
+        while gusts and now - gusts[0][0] > self.GUST_WINDOW:
+            gusts.popleft()
+        for w in self.WINDOWS:
+            samples = self.samples[w]
+            s = self.sums[w]
+            while samples and now - samples[0][0] > w:
+                sample = samples.popleft()
+                s[0] -= sample[1]
+                s[1] -= sample[2]
+                s[2] -= sample[3]
+
+    def values(self, now):
+        """The gust and averages at time now as a dict with the fields
+        wind_gust_10, wind_gust_dir_10, wind_speed_2, wind_dir_2,
+        wind_speed_10 and wind_dir_10."""
+        self.expire(now)
+        values = dict()
+        if self.gusts:
+            values['wind_gust_10'] = self.gusts[0][1]
+            values['wind_gust_dir_10'] = \
+                self.gusts[0][2] if self.gusts[0][1] > 0 else None
+        for w in self.WINDOWS:
+            n = len(self.samples[w])
+            if n == 0:
+                continue
+            s = self.sums[w]
+            label = w // 60
+            values['wind_speed_%s' % label] = max(0.0, s[0] / n)
+            if abs(s[1]) < 1e-9 and abs(s[2]) < 1e-9:
+                values['wind_dir_%s' % label] = None
+            else:
+                values['wind_dir_%s' % label] = \
+                    math.degrees(math.atan2(s[1], s[2])) % 360.0
+        return values
+
+    def check_gust(self, now, gust):
+        """Compare the 10-minute gust of the transmitter with our own
+        once the window is complete.  Returns False on a mismatch."""
+        if self.first is None or now - self.first < self.GUST_WINDOW:
+            return True
+        own = self.gusts[0][1] if self.gusts else 0.0
+        if abs(own - gust) > self.tolerance:
+            self.mismatches += 1
+            return False
+        return True
+
+
+class RainStatistics(object):
+    """Rain tips, rain rate and rain totals from the rain counter.
+
+    The tips are kept in a deque per window with a running sum, so the
+    totals over the last 15 and 60 minutes take constant time per packet.
+    The rain rate is that of the transmitter, which times the tips to 1/16
+    second, while its rate message is recent.  Otherwise it is calculated
+    from the interval between the last two tips that were seen, and it
+    decays with the time since the last tip like the rate of a Davis
+    console: no tip for 15 minutes means no rain.
+    """
+    WINDOWS = (900, 3600) # seconds
+    MAX_RATE_AGE = 60 # seconds the rate of the transmitter is used
+    MAX_TIP_AGE = 900 # seconds
+
+    def __init__(self, rain_per_tip):
+        self.rain_per_tip = rain_per_tip
+        self.last_count = None
+        self.tips = dict((w, collections.deque()) for w in self.WINDOWS)
+        self.sums = dict((w, 0) for w in self.WINDOWS)
+        self.last_tip = None
+        self.interval = None # seconds between the last two tips
+        self.rate_ts = None
+        self.tx_rate = None
+
+    def add_count(self, now, count):
+        """Add a value of the rain counter.  Returns the number of tips
+        since the previous value."""
+        if self.last_count is None:
+            tips = 0
+        else:
+            tips = count - self.last_count
+            # handle rain counter wrap around from 127 to 0
+            if tips < 0:
+                loginf("rain counter wraparound detected rain_count=%s" %
+                       tips)
+                tips += 128
+        self.last_count = count
+        if tips > 0:
+            if self.last_tip is not None:
+                self.interval = (now - self.last_tip) / tips
+            self.last_tip = now
+            for w in self.WINDOWS:
+                self.tips[w].append((now, tips))
+                self.sums[w] += tips
+        self.expire(now)
+        return tips
+
+    def add_rate(self, now, rate):
+        """Add a rain rate reported by the transmitter."""
+        self.rate_ts = now
+        self.tx_rate = rate
+
+    def expire(self, now):
+        for w in self.WINDOWS:
+            tips = self.tips[w]
+            while tips and now - tips[0][0] > w:
+                self.sums[w] -= tips.popleft()[1]
+
+    def rate(self, now):
+        if self.rate_ts is not None and now - self.rate_ts <= self.MAX_RATE_AGE:
+            # the transmitter only reports no rain 16 minutes after a tip
+            if self.tx_rate > 0 or self.last_tip is None \
+                    or now - self.last_tip > self.MAX_RATE_AGE:
+                return self.tx_rate
+        if self.last_tip is None or now - self.last_tip > self.MAX_TIP_AGE:
+            return 0.0
+        if self.interval is None:
+            # a single tip; use the rate over the window
+            return self.sums[self.WINDOWS[0]] * self.rain_per_tip * \
+                3600.0 / self.WINDOWS[0]
+        return self.rain_per_tip * 3600.0 / \
+            max(self.interval, now - self.last_tip)
+
+    def values(self, now):
+        """The rain rate and the rain totals at time now as a dict with
+        the fields rain_rate, rain_15 and rain_60."""
+        self.expire(now)
+        values = {'rain_rate': self.rate(now)}
+        for w in self.WINDOWS:
+            values['rain_%s' % (w // 60)] = self.sums[w] * self.rain_per_tip
+        return values
+
+
+class Histogram(object):
+    """Count, mean, max and a log2 histogram of durations.  Bucket n counts
+    the durations below 2^n microseconds."""
+    NUM_BUCKETS = 25 # up to 2^24 us (16 s)
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.cnt = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.hist = array.array('l', [0] * self.NUM_BUCKETS)
+
+    def record(self, seconds):
+        self.cnt += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        b = min(int(seconds * 1000000).bit_length(), self.NUM_BUCKETS - 1)
+        self.hist[b] += 1
+
+    def percentile(self, pct):
+        """Upper bound in seconds of the bucket that holds the percentile."""
+        target = pct / 100.0 * self.cnt
+        n = 0
+        for b in range(self.NUM_BUCKETS):
+            n += self.hist[b]
+            if n > 0 and n >= target:
+                return (1 << b) / 1000000.0
+        return None
+
+    def summary(self):
+        """count, mean, p50, p99 and max, in microseconds"""
+        if not self.cnt:
+            return "%7d" % 0
+        return "%7d %10.1f %10.1f %10.1f %10.1f" % (
+            self.cnt, 1000000.0 * self.total / self.cnt,
+            1000000.0 * self.percentile(50), 1000000.0 * self.percentile(99),
+            1000000.0 * self.max)
+
+
+class StageTimer(object):
+    """Latency histograms for the stages of the read loop.
+
+    The stages are:
+      read    - wait for a line from the serial port
+      decode  - utf-8 decoding of the line
+      parse   - parse_readings, including crc and wind
+      crc     - crc check of a raw message
+      wind    - wind speed error correction
+      packet  - mapping of the data to a loop packet
+      yield   - processing of the packet by weewx until the next read
+    """
+    STAGES = ('read', 'decode', 'parse', 'crc', 'wind', 'packet', 'yield')
+
+    def __init__(self):
+        self.stages = dict((s, Histogram()) for s in self.STAGES)
+
+    def reset(self):
+        for s in self.STAGES:
+            self.stages[s].reset()
+
+    def record(self, stage, seconds):
+        self.stages[stage].record(seconds)
+
+    def report(self):
+        lines = ["stage     count    mean_us     p50_us     p99_us     max_us"]
+        for s in self.STAGES:
+            if self.stages[s].cnt:
+                lines.append("%-7s %s" % (s, self.stages[s].summary()))
+        return lines
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path in ('/', '/metrics'):
+            get, content_type = self.server.get_metrics, 'text/plain; version=0.0.4'
+        elif path == '/current' and self.server.get_current is not None:
+            get, content_type = self.server.get_current, 'application/json'
+        else:
+            self.send_error(404)
+            return
+        try:
+            body = get().encode('utf-8')
+        except Exception as e:
+            logerr("metrics failed: %s" % e)
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # a unix socket has no client address
+        return str(self.client_address)
+
+    def log_message(self, fmt, *args):
+        dbg_serial(3, "metrics: " + fmt, args)
+
+
+class _TCPMetricsServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixMetricsServer(socketserver.ThreadingMixIn,
+                         socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class MetricsServer(object):
+    """Serve the driver metrics in the Prometheus text format over http,
+    on a local tcp port or a unix socket.
+
+    The server runs in its own thread.  It only reads the counters of the
+    driver, so it never blocks the read loop.  With get_current the current
+    conditions are served as json on /current.
+    """
+
+    def __init__(self, get_metrics, port=None, address='127.0.0.1',
+                 path=None, get_current=None):
+        if path is not None:
+            if os.path.exists(path):
+                os.unlink(path)
+            self.server = _UnixMetricsServer(path, _MetricsHandler)
+        else:
+            self.server = _TCPMetricsServer((address, port), _MetricsHandler)
+        self.server.get_metrics = get_metrics
+        self.server.get_current = get_current
+        self.path = path
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       name='meteostick-metrics')
+        self.thread.daemon = True
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        # shutdown waits for serve_forever, so only when it was started
+        if self.thread.is_alive():
+            self.server.shutdown()
+        self.server.server_close()
+        if self.path is not None and os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    # one setting per line: <name> <value>; the reply is 'ok' or 'error'
+    def handle(self):
+        for line in self.rfile:
+            line = line.decode('utf-8').strip()
+            if not line:
+                continue
+            try:
+                name, value = line.split(None, 1)
+                self.server.station.queue_setting(name, value)
+                reply = 'ok'
+            except ValueError as e:
+                reply = 'error: %s' % e
+            self.wfile.write((reply + '\n').encode('utf-8'))
+
+
+class _TCPControlServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixControlServer(socketserver.ThreadingMixIn,
+                         socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ControlServer(object):
+    """Change settings of the running meteostick over a local tcp port or
+    unix socket, e.g.
+
+      echo "rf_sensitivity 85" | nc -U /var/run/meteostick-control.sock
+
+    The settings are rf_sensitivity, transceiver_frequency, repeater and
+    the <name>_channel settings of the transmitters.  They are queued and
+    applied by the read loop between two frames, without a reset.
+    """
+
+    def __init__(self, station, port=None, address='127.0.0.1', path=None):
+        if path is not None:
+            if os.path.exists(path):
+                os.unlink(path)
+            self.server = _UnixControlServer(path, _ControlHandler)
+        else:
+            self.server = _TCPControlServer((address, port), _ControlHandler)
+        self.server.station = station
+        self.path = path
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       name='meteostick-control')
+        self.thread.daemon = True
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        # shutdown waits for serve_forever, so only when it was started
+        if self.thread.is_alive():
+            self.server.shutdown()
+        self.server.server_close()
+        if self.path is not None and os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def _prom_histogram(lines, name, labels, hist):
+    # cumulative buckets of a Histogram; bucket n ends at 2^n us
+    sep = ',' if labels else ''
+    n = 0
+    for b in range(hist.NUM_BUCKETS):
+        n += hist.hist[b]
+        lines.append('%s_bucket{%s%sle="%g"} %d' %
+                     (name, labels, sep, (1 << b) / 1000000.0, n))
+    lines.append('%s_bucket{%s%sle="+Inf"} %d' % (name, labels, sep, hist.cnt))
+    lines.append('%s_sum{%s} %s' % (name, labels, hist.total))
+    lines.append('%s_count{%s} %d' % (name, labels, hist.cnt))
+
+
+class LoopRing(object):
+    """Fixed-size ring of loop packets in a memory-mapped file.
+
+    The file starts with a header, followed by the names of the fields and
+    a ring of fixed-width records:
+
+      header   magic '8s', version 'I', header_size 'I', record_size 'I',
+               capacity 'I', nfields 'I', write_count 'Q' (little endian)
+      names    nfields names of 32 bytes, null padded
+      records  capacity records of seq 'Q', dateTime 'd' and one 'd' per
+               field; a missing value is NaN
+
+    Record n (counting from 0) is at slot n % capacity and has seq n + 1.
+    The writer fills a record, then its seq, then the write_count, so a
+    reader needs no lock: it reads the write_count, then the records
+    before it, and drops a record whose seq does not match, or changes
+    between before and after the copy, because it was overwritten while
+    being read.
+    """
+    MAGIC = b'MSTKRING'
+    VERSION = 1
+    HEADER = struct.Struct('<8sIIIIIQ')
+    WRITE_COUNT_OFFSET = 28
+    NAME_SIZE = 32
+    SEQ = struct.Struct('<Q')
+    DEFAULT_FIELDS = ['windSpeed', 'windDir', 'outTemp', 'outHumidity',
+                      'rain', 'rainRate', 'pressure', 'inTemp', 'radiation',
+                      'UV']
+
+    def __init__(self, path, fields=None, capacity=20000):
+        self.path = path
+        self.fields = list(fields or self.DEFAULT_FIELDS)
+        self.capacity = capacity
+        self.record = struct.Struct('<Qd' + 'd' * len(self.fields))
+        self.header_size = self.HEADER.size + self.NAME_SIZE * len(self.fields)
+        self.header_size = (self.header_size + 7) // 8 * 8
+        size = self.header_size + self.capacity * self.record.size
+        with open(path, 'a+b') as f:
+            f.seek(0)
+            header = f.read(self.HEADER.size)
+        self.write_count = self._existing_count(header, size)
+        self.fd = os.open(path, os.O_RDWR)
+        if self.write_count is None:
+            os.ftruncate(self.fd, 0)
+            os.ftruncate(self.fd, size)
+            self.write_count = 0
+        self.mm = mmap.mmap(self.fd, size)
+        if self.write_count == 0:
+            self.HEADER.pack_into(self.mm, 0, self.MAGIC, self.VERSION,
+                                  self.header_size, self.record.size,
+                                  self.capacity, len(self.fields), 0)
+            for i, name in enumerate(self.fields):
+                offset = self.HEADER.size + i * self.NAME_SIZE
+                self.mm[offset:offset + self.NAME_SIZE] = \
+                    name.encode('utf-8').ljust(self.NAME_SIZE, b'\0')
+        self.nan = float('nan')
+
+    def _existing_count(self, header, size):
+        # continue an existing ring with the same layout
+        if len(header) != self.HEADER.size or os.path.getsize(self.path) != size:
+            return None
+        magic, version, header_size, record_size, capacity, nfields, count = \
+            self.HEADER.unpack(header)
+        if magic != self.MAGIC or version != self.VERSION \
+                or header_size != self.header_size \
+                or record_size != self.record.size \
+                or capacity != self.capacity or nfields != len(self.fields):
+            return None
+        with open(self.path, 'rb') as f:
+            f.seek(self.HEADER.size)
+            names = f.read(self.NAME_SIZE * nfields)
+        for i, name in enumerate(self.fields):
+            stored = names[i * self.NAME_SIZE:(i + 1) * self.NAME_SIZE]
+            if stored.rstrip(b'\0').decode('utf-8') != name:
+                return None
+        return count
+
+    def append(self, packet):
+        n = self.write_count
+        offset = self.header_size + (n % self.capacity) * self.record.size
+        values = [packet.get(k) for k in self.fields]
+        values = [self.nan if v is None else v for v in values]
+        # invalidate the slot, then write the record and publish it
+        self.SEQ.pack_into(self.mm, offset, 0)
+        self.record.pack_into(self.mm, offset, 0, packet['dateTime'], *values)
+        self.SEQ.pack_into(self.mm, offset, n + 1)
+        self.write_count = n + 1
+        self.SEQ.pack_into(self.mm, self.WRITE_COUNT_OFFSET, n + 1)
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            os.close(self.fd)
+            self.mm = None
+
+
+class LoopRingReader(object):
+    """Read the latest records of a LoopRing file from another process."""
+
+    def __init__(self, path):
+        self.fd = os.open(path, os.O_RDONLY)
+        self.mm = mmap.mmap(self.fd, 0, access=mmap.ACCESS_READ)
+        magic, version, self.header_size, record_size, self.capacity, \
+            nfields, _ = LoopRing.HEADER.unpack_from(self.mm, 0)
+        if magic != LoopRing.MAGIC or version != LoopRing.VERSION:
+            raise ValueError("%s is not a loop ring file" % path)
+        self.fields = []
+        for i in range(nfields):
+            offset = LoopRing.HEADER.size + i * LoopRing.NAME_SIZE
+            name = self.mm[offset:offset + LoopRing.NAME_SIZE]
+            self.fields.append(name.rstrip(b'\0').decode('utf-8'))
+        self.record = struct.Struct('<Qd' + 'd' * nfields)
+        if self.record.size != record_size:
+            raise ValueError("unexpected record size in %s" % path)
+
+    def latest(self, seconds=None, max_records=None):
+        """Records of the last seconds (or the last max_records), oldest
+        first, as dicts with dateTime and the fields that have a value."""
+        count = LoopRing.SEQ.unpack_from(self.mm, LoopRing.WRITE_COUNT_OFFSET)[0]
+        first = max(0, count - self.capacity)
+        if max_records is not None:
+            first = max(first, count - max_records)
+        records = []
+        for n in range(count - 1, first - 1, -1):
+            offset = self.header_size + (n % self.capacity) * self.record.size
+            # the seq before and after the copy tells that the record was
+            # not overwritten by the writer while it was copied
+            seq = LoopRing.SEQ.unpack_from(self.mm, offset)[0]
+            if seq != n + 1:
+                break
+            values = self.record.unpack_from(self.mm, offset)
+            if LoopRing.SEQ.unpack_from(self.mm, offset)[0] != seq:
+                break
+            if seconds is not None and records \
+                    and values[1] < records[0]['dateTime'] - seconds:
+                break
+            record = {'dateTime': values[1]}
+            for k, v in zip(self.fields, values[2:]):
+                if v == v:  # not NaN
+                    record[k] = v
+            records.append(record)
+        records.reverse()
+        return records
+
+    def close(self):
+        self.mm.close()
+        os.close(self.fd)
+
+
+class RFStatsStore(object):
+    """Per-channel rf statistics of each archive interval in a sqlite table.
+
+    Rows are buffered and written batch intervals at a time in a single
+    transaction.  The database is in WAL mode, so readers do not block the
+    writes.  The primary key and an index on channel and dateTime serve
+    time-range queries over all channels or over one channel.
+    """
+    TABLE = 'rf_stats'
+    COLUMNS = ('dateTime', 'channel', 'label', 'interval', 'rf_sensitivity',
+               'count', 'missed', 'pct_good', 'min_signal', 'max_signal',
+               'avg_signal', 'last_signal')
+
+    def __init__(self, path, batch=6):
+        self.path = path
+        self.batch = batch
+        self.rows = []
+        self.intervals = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS %s ('
+                'dateTime INTEGER NOT NULL, channel INTEGER NOT NULL, '
+                'label TEXT, interval INTEGER, rf_sensitivity INTEGER, '
+                'count INTEGER, missed INTEGER, pct_good INTEGER, '
+                'min_signal INTEGER, max_signal INTEGER, avg_signal INTEGER, '
+                'last_signal INTEGER, PRIMARY KEY (dateTime, channel))'
+                % self.TABLE)
+            self.conn.execute(
+                'CREATE INDEX IF NOT EXISTS %s_channel_time ON %s '
+                '(channel, dateTime)' % (self.TABLE, self.TABLE))
+        self.insert = 'INSERT OR REPLACE INTO %s (%s) VALUES (%s)' % (
+            self.TABLE, ', '.join(self.COLUMNS),
+            ', '.join('?' * len(self.COLUMNS)))
+
+    def add(self, rows):
+        """Add the rows of one interval, dicts with the COLUMNS."""
+        self.rows.extend(tuple(row.get(k) for k in self.COLUMNS)
+                         for row in rows)
+        self.intervals += 1
+        if self.intervals >= self.batch:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            with self.conn:
+                self.conn.executemany(self.insert, self.rows)
+            dbg_serial(1, "stored %s rows of rf statistics", len(self.rows))
+        self.rows = []
+        self.intervals = 0
+
+    def query(self, start, end, channel=None):
+        """Rows with start < dateTime <= end, oldest first, as dicts."""
+        sql = 'SELECT %s FROM %s WHERE dateTime > ? AND dateTime <= ?' % (
+            ', '.join(self.COLUMNS), self.TABLE)
+        args = [start, end]
+        if channel is not None:
+            sql += ' AND channel = ?'
+            args.append(channel)
+        sql += ' ORDER BY dateTime, channel'
+        return [dict(zip(self.COLUMNS, row))
+                for row in self.conn.execute(sql, args)]
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.flush()
+            finally:
+                self.conn.close()
+                self.conn = None
+
+
+class _Subscriber(object):
+    """A broker client with a bounded queue, drained by its own thread."""
+
+    def __init__(self, sock, maxlen):
+        self.sock = sock
+        self.queue = collections.deque(maxlen=maxlen)
+        self.cond = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, msg):
+        with self.cond:
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+            self.queue.append(msg)
+            self.cond.notify()
+
+    def run(self):
+        try:
+            while True:
+                with self.cond:
+                    while not self.queue and not self.closed:
+                        self.cond.wait()
+                    if self.closed:
+                        break
+                    msg = self.queue.popleft()
+                self.sock.sendall(msg)
+        except (socket.error, OSError) as e:
+            dbg_serial(1, "broker subscriber gone: %s", e)
+        self.close()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        try:
+            self.sock.close()
+        except (socket.error, OSError):
+            pass
+
+
+class PacketBroker(object):
+    """Share the data of one meteostick with other processes.
+
+    The process that owns the serial port publishes every raw line and
+    every loop packet.  Subscribers connect to a local tcp port or unix
+    socket and receive lines of the form
+
+      R <raw line>
+      P <loop packet as json>
+
+    Each subscriber has a bounded queue; when a subscriber does not keep
+    up, its oldest messages are dropped, so publishing never blocks the
+    read loop.
+    """
+    DEFAULT_QUEUE = 1000
+
+    def __init__(self, port=None, address='127.0.0.1', path=None,
+                 maxlen=DEFAULT_QUEUE):
+        if path is not None:
+            if os.path.exists(path):
+                os.unlink(path)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.bind(path)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.sock.bind((address, port))
+        self.sock.listen(5)
+        self.path = path
+        self.maxlen = maxlen
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._accept,
+                                       name='meteostick-broker')
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def address(self):
+        return self.sock.getsockname()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except (socket.error, OSError):
+                break
+            sub = _Subscriber(conn, self.maxlen)
+            with self.lock:
+                self.subscribers.append(sub)
+            t = threading.Thread(target=sub.run,
+                                 name='meteostick-broker-subscriber')
+            t.daemon = True
+            t.start()
+            loginf("broker: new subscriber (%s)" % len(self.subscribers))
+
+    def _publish(self, msg):
+        with self.lock:
+            self.subscribers = [s for s in self.subscribers if not s.closed]
+            subscribers = list(self.subscribers)
+        for sub in subscribers:
+            sub.put(msg)
+
+    def publish_raw(self, raw):
+        self._publish(('R %s\n' % raw).encode('utf-8'))
+
+    def publish_packet(self, packet):
+        self._publish(('P %s\n' % json.dumps(packet)).encode('utf-8'))
+
+    def close(self):
+        self.sock.close()
+        with self.lock:
+            for sub in self.subscribers:
+                sub.close()
+            self.subscribers = []
+        if self.path is not None and os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class BrokerConnection(object):
+    """Receive the raw lines of a PacketBroker in place of a serial port.
+
+    The connection offers the part of the serial port interface that the
+    driver uses for reading.  A lost connection raises a SerialException,
+    and the next read connects again.
+    """
+
+    def __init__(self, broker, timeout):
+        # broker is host:port or the path of a unix socket
+        self.broker = broker
+        self.timeout = timeout
+        self.sock = None
+        self.buf = b''
+
+    def _connect(self):
+        if ':' in self.broker:
+            host, port = self.broker.rsplit(':', 1)
+            self.sock = socket.create_connection((host, int(port)),
+                                                 self.timeout)
+        else:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(self.timeout)
+            self.sock.connect(self.broker)
+        self.buf = b''
+        loginf("connected to broker %s" % self.broker)
+
+    def readline(self):
+        """Returns the next raw line, or nothing after the timeout."""
+        try:
+            if self.sock is None:
+                self._connect()
+            self.sock.settimeout(self.timeout)
+            while True:
+                i = self.buf.find(b'\n')
+                while i >= 0:
+                    line = self.buf[:i + 1]
+                    self.buf = self.buf[i + 1:]
+                    if line.startswith(b'R '):
+                        return line[2:]
+                    i = self.buf.find(b'\n')
+                data = self.sock.recv(4096)
+                if not data:
+                    raise socket.error("connection closed by broker")
+                self.buf += data
+        except socket.timeout:
+            return b''
+        except (socket.error, OSError) as e:
+            self.close()
+            raise serial.serialutil.SerialException(
+                "broker %s: %s" % (self.broker, e))
+
+    def inWaiting(self):
+        return self.buf.count(b'\n')
+
+    def flushInput(self):
+        self.buf = b''
+
+    def read(self, size=1):
+        return b''
+
+    def write(self, data):
+        raise serial.serialutil.SerialException(
+            "cannot send commands to the meteostick through the broker")
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+# serial ports that are probed with port = auto, stable names first
+DISCOVERY_PATTERNS = ['/dev/serial/by-id/*', '/dev/ttyUSB*', '/dev/ttyACM*']
+
+
+def candidate_ports(patterns=None):
+    """The serial ports that match the patterns, each device once under the
+    first name it was found with."""
+    ports = []
+    seen = set()
+    for pattern in patterns or DISCOVERY_PATTERNS:
+        for port in sorted(glob.glob(pattern)):
+            device = os.path.realpath(port)
+            if device not in seen:
+                seen.add(device)
+                ports.append(port)
+    return ports
+
+
+def probe_port(port, baudrate=115200, timeout=3.0):
+    """Send a reset to the port and return the response if it answers like
+    a meteostick, otherwise None.  A port that is locked by another
+    process is skipped, so nothing is sent to it."""
+    deadline = _monotonic() + timeout
+    try:
+        serial_port = serial.Serial(port, baudrate, timeout=0.1,
+                                    exclusive=True)
+    except (serial.SerialException, OSError) as e:
+        dbg_serial(1, "skip port %s: %s", (port, e))
+        return None
+    try:
+        serial_port.flushInput()
+        serial_port.write(b'r\n')
+        response = b''
+        while _monotonic() < deadline:
+            response += serial_port.read(256)
+            if b'?' in response:
+                text = response.decode('utf-8', 'replace')
+                if 'meteostick' in text.lower():
+                    return text
+                break
+    except (serial.SerialException, OSError) as e:
+        dbg_serial(1, "probe %s: %s", (port, e))
+    finally:
+        serial_port.close()
+    return None
+
+
+def discover_port(patterns=None, baudrate=115200, timeout=3.0, cache=None):
+    """Find the serial port of the meteostick.
+
+    The port in the cache file is tried first.  Otherwise all candidate
+    ports are probed at the same time, each in its own thread, so the
+    discovery takes no longer than one probe.  When several ports answer
+    the first candidate wins.  The port that was found is written to the
+    cache file.  Returns None if no meteostick answers.
+    """
+    if cache is not None:
+        try:
+            with open(cache) as f:
+                cached = f.read().strip()
+        except (IOError, OSError):
+            cached = None
+        if cached and os.path.exists(cached) \
+                and probe_port(cached, baudrate, timeout) is not None:
+            loginf("found meteostick on cached port %s" % cached)
+            return cached
+    ports = candidate_ports(patterns)
+    dbg_serial(1, "probe ports %s", ports)
+    responses = dict()
+
+    def probe(port):
+        responses[port] = probe_port(port, baudrate, timeout)
+
+    threads = [threading.Thread(target=probe, args=(port,),
+                                name='meteostick-probe') for port in ports]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    deadline = _monotonic() + timeout + 1.0
+    for t in threads:
+        t.join(max(deadline - _monotonic(), 0))
+    found = [port for port in ports if responses.get(port) is not None]
+    if not found:
+        return None
+    if len(found) > 1:
+        loginf("meteostick answers on %s, using the first" % found)
+    port = found[0]
+    loginf("found meteostick on port %s" % port)
+    if cache is not None:
+        try:
+            with open(cache, 'w') as f:
+                f.write(port + '\n')
+        except (IOError, OSError) as e:
+            loginf("cannot cache port in %s: %s" % (cache, e))
+    return port
+
+
 class MeteostickDriver(weewx.drivers.AbstractDevice, weewx.engine.StdService):
     NUM_CHAN = 10 # 8 channels, one fake channel (9), one unused channel (0)
     DEFAULT_RAIN_BUCKET_TYPE = 1
@@ -219,6 +2074,16 @@ class MeteostickDriver(weewx.drivers.AbstractDevice, weewx.engine.StdService):
         'inTemp': 'temp_in',  # temperature inside meteostick
         'windSpeed': 'wind_speed',
         'windDir': 'wind_dir',
+        # The gust of each wind sample, the gust over the last 10 minutes and
+        # the 2- and 10-minute wind averages (see wind_statistics)
+        #'windGust': 'wind_gust',
+        #'windGustDir': 'wind_gust_dir',
+        #'windGust10': 'wind_gust_10',
+        #'windGustDir10': 'wind_gust_dir_10',
+        #'windSpeed2': 'wind_speed_2',
+        #'windDir2': 'wind_dir_2',
+        #'windSpeed10': 'wind_speed_10',
+        #'windDir10': 'wind_dir_10',
         'outTemp': 'temperature',
         'outHumidity': 'humidity',
         'inHumidity': 'humidity_in',
@@ -254,8 +2119,10 @@ class MeteostickDriver(weewx.drivers.AbstractDevice, weewx.engine.StdService):
         'referenceVoltage': 'solar_power',
         'supplyVoltage': 'supercap_volt'}
 
-    def __init__(self, engine, config_dict):
+    def __init__(self, engine, config_dict, clock=SYSTEM_CLOCK,
+                 connection=None):
         loginf('driver version is %s' % DRIVER_VERSION)
+        self.clock = clock
         if engine:
             weewx.engine.StdService.__init__(self, engine, config_dict)
         stn_dict = config_dict.get(DRIVER_NAME, {})
@@ -268,87 +2135,535 @@ class MeteostickDriver(weewx.drivers.AbstractDevice, weewx.engine.StdService):
         DEBUG_RAIN = int(stn_dict.get('debug_rain', DEBUG_RAIN))
         global DEBUG_RFS
         DEBUG_RFS = int(stn_dict.get('debug_rf_sensitivity', DEBUG_RFS))
+        # StageTimer that measures the stages of the read loop, or None
+        self.timer = None
+        if weeutil.weeutil.to_bool(stn_dict.get('stage_timing', False)):
+            self.timer = StageTimer()
+            loginf('stage timing enabled')
+        self.latency = Histogram()  # from arrival of data to yield of packet
+        # optionally keep the loop packets in a memory-mapped ring file
+        self.ring = None
+        if 'ring_file' in stn_dict:
+            fields = stn_dict.get('ring_fields')
+            if isinstance(fields, str):
+                fields = [fields]
+            self.ring = LoopRing(stn_dict['ring_file'], fields,
+                                 int(stn_dict.get('ring_records', 20000)))
+            loginf('loop ring file is %s with %s records of %s' %
+                   (self.ring.path, self.ring.capacity, self.ring.fields))
+        # optionally keep the rf statistics of each interval in sqlite
+        self.rf_store = None
+        if 'rf_stats_database' in stn_dict:
+            self.rf_store = RFStatsStore(
+                stn_dict['rf_stats_database'],
+                int(stn_dict.get('rf_stats_batch', 6)))
+            loginf('rf statistics database is %s, batches of %s intervals' %
+                   (self.rf_store.path, self.rf_store.batch))
+        self.profile_seconds = int(stn_dict.get('profile_seconds', 60))
+        self.profile_requested = False
+        self.profiler = None
+        self.profile_end = None
+
+        # the unit system of the loop packets
+        unit_system = stn_dict.get('unit_system', 'METRICWX')
+        if unit_system not in weewx.units.unit_constants:
+            raise ValueError("invalid unit_system %s" % unit_system)
+        self.units = Units(weewx.units.unit_constants[unit_system])
+        loginf('using unit_system %s' % unit_system)
 
         bucket_type = int(stn_dict.get('rain_bucket_type',
                                        self.DEFAULT_RAIN_BUCKET_TYPE))
         if bucket_type not in [0, 1]:
             raise ValueError("unsupported rain bucket type %s" % bucket_type)
-        self.rain_per_tip = 0.254 if bucket_type == 0 else 0.2 # mm
+        self.rain_per_tip = self.units.rain_per_tip(bucket_type)
         loginf('using rain_bucket_type %s' % bucket_type)
         self.sensor_map = dict(self.DEFAULT_SENSOR_MAP)
         if 'sensor_map' in stn_dict:
             self.sensor_map.update(stn_dict['sensor_map'])
         loginf('sensor map is: %s' % self.sensor_map)
+        self.field_map = self._invert_sensor_map(self.sensor_map)
         self.max_tries = int(stn_dict.get('max_tries', 10))
         self.retry_wait = int(stn_dict.get('retry_wait', 10))
-        self.last_rain_count = None
         self.first_rf_stats = True
+        # optionally merge the packets of several frames into one packet
+        max_latency = float(stn_dict.get('coalesce_max_latency', 0))
+        if max_latency > 0:
+            min_fields = int(stn_dict.get('coalesce_min_fields', 0))
+            self.coalescer = PacketCoalescer(max_latency, min_fields)
+            loginf('coalesce packets: max_latency=%s min_fields=%s' %
+                   (max_latency, min_fields))
+        else:
+            self.coalescer = None
+        # optionally emit slow-moving fields only when they change
+        if 'deadband' in stn_dict or 'refresh_interval' in stn_dict:
+            self.deadband = Deadband(stn_dict.get('deadband', {}),
+                                     stn_dict.get('refresh_interval', {}))
+            loginf('deadband is: %s refresh_interval is: %s' %
+                   (self.deadband.deadband, self.deadband.refresh_interval))
+        else:
+            self.deadband = None
+        # optionally generate archive records in the driver
+        interval = int(stn_dict.get('archive_interval', 0))
+        if interval > 0:
+            if interval % 60:
+                raise ValueError("archive_interval must be a multiple of 60")
+            self.archiver = ArchiveAccumulator(interval)
+            loginf('generate archive records with interval %s' % interval)
+        else:
+            self.archiver = None
+        # latest value of each field, optionally merged into the packets
+        self.current = CurrentConditions(stn_dict.get('max_age', {}))
+        self.merge_current = weeutil.weeutil.to_bool(
+            stn_dict.get('merge_current_conditions', False))
+        # rain tips, and optionally rain rate and totals of the iss
+        self.rain_stats = RainStatistics(self.rain_per_tip)
+        self.rain_statistics = weeutil.weeutil.to_bool(
+            stn_dict.get('rain_statistics', True))
+        # rolling wind gust and averages of the wind channel
+        if weeutil.weeutil.to_bool(stn_dict.get('wind_statistics', True)):
+            self.wind_stats = WindStatistics(self.units.mph)
+        else:
+            self.wind_stats = None
         self._init_rf_stats()
-
-        self.station = Meteostick(**stn_dict)
+        self.rf_quality = RFStatistics(self.NUM_CHAN)
+
+        self.station = Meteostick(clock=clock, connection=connection,
+                                  **stn_dict)
+        self.station.units = self.units
+        self.station.timer = self.timer
+        # decode only the messages with fields that end up in a packet
+        if not weeutil.weeutil.to_bool(stn_dict.get('decode_all', False)):
+            self.station.set_needed(self._needed_fields())
+        # optionally adjust the rf sensitivity to the reception
+        self.rf_tuner = None
+        if weeutil.weeutil.to_bool(stn_dict.get('rf_auto_tune', False)):
+            if self.station.broker is not None:
+                loginf("rf_auto_tune is not possible through the broker")
+            else:
+                self.rf_tuner = RFTuner(
+                    int(stn_dict.get('rf_sensitivity_min', 70)),
+                    int(stn_dict.get('rf_sensitivity_max', 110)),
+                    int(stn_dict.get('rf_tune_interval', 600)),
+                    float(stn_dict.get('rf_tune_max_crc_rate', 0.05)))
+                loginf('rf auto tune: rf_sensitivity %s-%s interval=%s '
+                       'max_crc_rate=%s' %
+                       (self.rf_tuner.minimum, self.rf_tuner.maximum,
+                        self.rf_tuner.interval, self.rf_tuner.max_crc_rate))
         self.station.open()
-        self.station.reset()
-        self.station.configure()
+        if self.station.broker is None:
+            self.station.reset()
+            self.station.configure()
+
+        # optionally accept changes of settings while running
+        self.control_server = None
+        if 'control_port' in stn_dict or 'control_socket' in stn_dict:
+            self.control_server = ControlServer(
+                self.station,
+                port=int(stn_dict.get('control_port', 0)),
+                address=stn_dict.get('control_address', '127.0.0.1'),
+                path=stn_dict.get('control_socket'))
+            loginf('control on %s' % (self.control_server.address,))
+
+        # optionally share the data with other processes
+        self.broker = None
+        if 'broker_port' in stn_dict or 'broker_socket' in stn_dict:
+            self.broker = PacketBroker(
+                port=int(stn_dict.get('broker_port', 0)),
+                address=stn_dict.get('broker_address', '127.0.0.1'),
+                path=stn_dict.get('broker_socket'),
+                maxlen=int(stn_dict.get('broker_queue',
+                                        PacketBroker.DEFAULT_QUEUE)))
+            loginf('broker listening on %s' % (self.broker.address,))
+
+        # optionally serve metrics over http on a local port or unix socket
+        self.metrics_server = None
+        if 'metrics_port' in stn_dict or 'metrics_socket' in stn_dict:
+            self.metrics_server = MetricsServer(
+                self.get_metrics,
+                port=int(stn_dict.get('metrics_port', 0)),
+                address=stn_dict.get('metrics_address', '127.0.0.1'),
+                path=stn_dict.get('metrics_socket'),
+                get_current=lambda: json.dumps(self.get_current_conditions()))
+            loginf('serving metrics on %s' % (self.metrics_server.address,))
+
+        # the stages of the read loop, see genLoopPackets
+        self.stages = [self.parse_stage, self.enrich_stage, self.map_stage]
+        if self.archiver is not None:
+            self.stages.append(self.archive_stage)
+        if self.coalescer is not None:
+            self.stages.append(self.coalesce_stage)
+        self.stages.append(self.emit_stage)
 
         # bind to new archive record events so that we can update the rf
         # stats on each archive record.
         if engine:
             self.bind(weewx.NEW_ARCHIVE_RECORD, self.new_archive_record)
 
+        # signals to dump the stage timing and to start a profile
+        for name, handler in [('timing_signal', self._on_timing_signal),
+                              ('profile_signal', self._on_profile_signal)]:
+            if name in stn_dict:
+                signum = getattr(signal, 'SIG' + stn_dict[name].upper())
+                signal.signal(signum, handler)
+                loginf('%s is SIG%s' % (name, stn_dict[name].upper()))
+
+        # the servers are started when the driver is complete
+        for server in (self.control_server, self.metrics_server):
+            if server is not None:
+                server.start()
+
+    def _on_timing_signal(self, signum, frame):
+        self._report_timing()
+
+    def _on_profile_signal(self, signum, frame):
+        # the profile is started by the read loop
+        self.profile_requested = True
+
+    def _report_timing(self):
+        if self.timer is None:
+            loginf("stage timing is not enabled")
+            return
+        for line in self.timer.report():
+            loginf("timing: %s" % line)
+
+    def _check_profile(self):
+        if self.profile_requested and self.profiler is None:
+            import cProfile
+            self.profile_requested = False
+            self.profiler = cProfile.Profile()
+            self.profile_end = _monotonic() + self.profile_seconds
+            loginf("start profile for %s seconds" % self.profile_seconds)
+            self.profiler.enable()
+        elif self.profiler is not None and _monotonic() > self.profile_end:
+            self.profiler.disable()
+            import pstats
+            try:
+                from StringIO import StringIO
+            except ImportError:
+                from io import StringIO
+            out = StringIO()
+            stats = pstats.Stats(self.profiler, stream=out)
+            stats.sort_stats('cumulative').print_stats(25)
+            for line in out.getvalue().splitlines():
+                loginf("profile: %s" % line)
+            self.profiler = None
+
     def closePort(self):
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+        if self.rf_store is not None:
+            self.rf_store.close()
+            self.rf_store = None
+        if self.broker is not None:
+            self.broker.close()
+            self.broker = None
+        if self.control_server is not None:
+            self.control_server.stop()
+            self.control_server = None
         if self.station is not None:
             self.station.close()
             self.station = None
 
+    def get_metrics(self):
+        """The driver counters in the Prometheus text exposition format."""
+        station = self.station
+        lines = []
+        lines.append('# TYPE meteostick_frames_total counter')
+        for key, cnt in sorted(list(station.frames.items()), key=str):
+            lines.append('meteostick_frames_total{channel="%s",message_type="%s"} %d'
+                         % (key[0], key[1], cnt))
+        lines.append('# TYPE meteostick_decode_errors_total counter')
+        for key, cnt in sorted(list(station.errors.items())):
+            lines.append('meteostick_decode_errors_total{category="%s"} %d'
+                         % (key, cnt))
+        lines.append('# TYPE meteostick_rejected_total counter')
+        lines.append('meteostick_rejected_total %d' % station.rejected)
+        lines.append('# TYPE meteostick_skipped_decodes_total counter')
+        for message_type, cnt in sorted(list(station.skipped.items())):
+            lines.append('meteostick_skipped_decodes_total{message_type="%s"} %d'
+                         % (message_type, cnt))
+        lines.append('# TYPE meteostick_read_retries_total counter')
+        lines.append('meteostick_read_retries_total %d' % station.read_retries)
+        lines.append('# TYPE meteostick_read_timeouts_total counter')
+        lines.append('meteostick_read_timeouts_total %d' % station.read_timeouts)
+        lines.append('# TYPE meteostick_backlog_total counter')
+        lines.append('meteostick_backlog_total %d' % station.backlog)
+        lines.append('# TYPE meteostick_rf_sensitivity gauge')
+        lines.append('meteostick_rf_sensitivity %d' % station.rfs)
+        if self.rf_tuner is not None:
+            lines.append('# TYPE meteostick_rf_tune_changes_total counter')
+            lines.append('meteostick_rf_tune_changes_total %d'
+                         % self.rf_tuner.changes)
+        lines.append('# TYPE meteostick_missed_total counter')
+        for ch in sorted(station.scheduler.missed):
+            lines.append('meteostick_missed_total{channel="%s"} %d'
+                         % (ch, station.scheduler.missed[ch]))
+        lines.append('# TYPE meteostick_rf_signal_db gauge')
+        lines.append('# TYPE meteostick_pct_good gauge')
+        for ch in sorted(station.scheduler.period):
+            quality = self.get_rf_quality(ch)
+            for q in ('5', '50', '95'):
+                value = quality['signal_p' + q]
+                if value is not None:
+                    lines.append('meteostick_rf_signal_db{channel="%s",quantile="0.%02d"} %d'
+                                 % (ch, int(q), value))
+            for w in ('1m', '5m', '15m'):
+                value = quality['pct_good_' + w]
+                if value is not None:
+                    lines.append('meteostick_pct_good{channel="%s",window="%s"} %.1f'
+                                 % (ch, w, value))
+        lines.append('# TYPE meteostick_packet_latency_seconds histogram')
+        _prom_histogram(lines, 'meteostick_packet_latency_seconds', '',
+                        self.latency)
+        if self.timer is not None:
+            lines.append('# TYPE meteostick_stage_latency_seconds histogram')
+            for s in StageTimer.STAGES:
+                _prom_histogram(lines, 'meteostick_stage_latency_seconds',
+                                'stage="%s"' % s, self.timer.stages[s])
+        return '\n'.join(lines) + '\n'
+
+    def get_current_conditions(self):
+        """The latest value of each field of the loop packets that is not
+        stale, as a dict of field to a dict with the value, the time it
+        arrived, its age in seconds and the channel it came from."""
+        now = self.clock.monotonic()
+        wall = self.clock.time()
+        conditions = self.current.get(now)
+        for k in conditions:
+            conditions[k]['time'] = wall - conditions[k]['age']
+        return conditions
+
     @property
     def hardware_name(self):
         return 'Meteostick'
 
+    @property
+    def archive_interval(self):
+        if self.archiver is None:
+            raise NotImplementedError("archive_interval is not configured")
+        return self.archiver.interval
+
+    def genArchiveRecords(self, since_ts):
+        if self.archiver is None:
+            raise NotImplementedError("archive_interval is not configured")
+        record = self.archiver.close(self.clock.time())
+        if record is not None:
+            self._add_rx_check(record)
+        for record in self.archiver.get_records(since_ts):
+            yield record
+
+    def _add_rx_check(self, record):
+        # The rf statistics are flushed with each archive record, so at this
+        # point they are for the interval of the record.
+        ch = self.station.channels['iss']
+        cnt = self.rf_stats['cnt'][ch]
+        if not self.first_rf_stats and cnt > 0:
+            record['rxCheckPercent'] = \
+                int(0.5 + 100.0 * cnt / (cnt + self.rf_stats['missed'][ch]))
+
     def genLoopPackets(self):
+        return self.pipeline(self.serial_source())
+
+    # The read loop is a pipeline of generators.  A source yields a Reading
+    # for each line, each stage takes the readings of the previous stage
+    # and yields them on, and the last stage yields the loop packets.
+    # Stages can be added to self.stages, reordered, or run on their own.
+    # A capture is replayed through the whole read loop, including the
+    # serial source, by passing a port-like object as the connection (see
+    # tests/replay.py).
+
+    def pipeline(self, source):
+        readings = source
+        for stage in self.stages:
+            readings = stage(readings)
+        return readings
+
+    def serial_source(self):
+        """Readings from the meteostick, or from the broker of another
+        process."""
         while True:
-            readings = self.station.get_readings_with_retry(self.max_tries,
-                                                            self.retry_wait)
-            data = self.station.parse_readings(readings, self.rain_per_tip)
+            if self.profile_requested or self.profiler is not None:
+                self._check_profile()
+            raw = self.station.get_readings_with_retry(self.max_tries,
+                                                       self.retry_wait)
+            if raw and self.broker is not None:
+                self.broker.publish_raw(raw)
+            yield Reading(raw)
+
+    def parse_stage(self, readings):
+        # framing, crc check and decoding of the raw messages
+        timer = self.timer
+        for reading in readings:
+            if timer is not None:
+                t0 = _monotonic()
+            reading.data = self.station.parse_readings(reading.raw,
+                                                       self.rain_per_tip)
+            if timer is not None:
+                timer.record('parse', _monotonic() - t0)
+            yield reading
+
+    def enrich_stage(self, readings):
+        # rf, wind and rain statistics
+        for reading in readings:
+            data = reading.data
             if 'channel' in data:
                 self._update_rf_stats(data['channel'], data['rf_signal'],
                                       data['rf_missed'])
+            if self.wind_stats is not None and data:
+                self._update_wind_stats(data)
+            if 'channel' in data:
+                self._update_rain_stats(data)
+            if self.rf_tuner is not None:
+                self._tune_rf(data)
+            yield reading
+
+    def map_stage(self, readings):
+        # the data in database fields
+        timer = self.timer
+        for reading in readings:
+            data = reading.data
             if data:
-                dbg_parse(2, "data: %s" % data)
+                if timer is not None:
+                    t0 = _monotonic()
+                dbg_parse(2, "data: %s", data)
                 packet = self._data_to_packet(data)
                 if packet is not None:
-                    dbg_parse(3, "packet: %s" % packet)
-                    yield packet
+                    self.current.update(packet, data['arrival'],
+                                        data.get('channel', RAW_CHANNEL))
+                    reading.packet = packet
+                    reading.packets = [packet]
+                if timer is not None:
+                    timer.record('packet', _monotonic() - t0)
+            yield reading
+
+    def archive_stage(self, readings):
+        for reading in readings:
+            if reading.packet is not None:
+                record = self.archiver.add(reading.packet)
+                if record is not None:
+                    self._add_rx_check(record)
+            yield reading
+
+    def coalesce_stage(self, readings):
+        for reading in readings:
+            # a packet is due when the window expired, even if this
+            # reading did not produce a packet
+            now = self.clock.time()
+            merged = self.coalescer.expire(now)
+            packet = reading.packet
+            if packet is not None:
+                packet = self.coalescer.add(packet, now)
+            reading.packet = packet
+            reading.packets = [p for p in (merged, packet) if p is not None]
+            yield reading
+
+    def emit_stage(self, readings):
+        # the sinks of the packets, then the packets themselves
+        timer = self.timer
+        for reading in readings:
+            for out in reading.packets:
+                dbg_parse(3, "packet: %s", out)
+                t2 = _monotonic()
+                if out is reading.packet:
+                    self.latency.record(
+                        self.clock.monotonic() - reading.data['arrival'])
+                if self.merge_current:
+                    self.current.merge(out, self.clock.monotonic())
+                if self.ring is not None:
+                    self.ring.append(out)
+                if self.broker is not None:
+                    self.broker.publish_packet(out)
+                yield out
+                if timer is not None:
+                    timer.record('yield', _monotonic() - t2)
+
+    def _needed_fields(self):
+        """The fields of the data that are used by the driver."""
+        needed = set(self.field_map)
+        needed.add('rain_count') # the rain delta is always reported
+        if self.rain_statistics:
+            needed.add('rain_rate')
+        if self.wind_stats is not None:
+            needed.update(['wind_speed', 'wind_dir', 'wind_gust_10_tx'])
+        return needed
+
+    @staticmethod
+    def _invert_sensor_map(sensor_map):
+        # index of sensor observation to the database field names it maps to
+        field_map = dict()
+        for k in sensor_map:
+            field_map.setdefault(sensor_map[k], []).append(k)
+        return dict((x, tuple(field_map[x])) for x in field_map)
 
     def _data_to_packet(self, data):
         packet = dict()
-        # map sensor observations to database field names
-        for k in self.sensor_map:
-            if self.sensor_map[k] in data:
-                packet[k] = data[self.sensor_map[k]]
+        # map sensor observations to database field names; only the
+        # observations in data need to be looked at
+        field_map = self.field_map
+        for x in data:
+            if x in field_map:
+                value = data[x]
+                for k in field_map[x]:
+                    packet[k] = value
         # convert the rain count to a rain delta measure
-        if 'rain_count' in data:
-            if self.last_rain_count is not None:
-                rain_count = data['rain_count'] - self.last_rain_count
-            else:
-                rain_count = 0
-            # handle rain counter wrap around from 127 to 0
-            if rain_count < 0:
-                loginf("rain counter wraparound detected rain_count=%s" %
-                       rain_count)
-                rain_count += 128
-            self.last_rain_count = data['rain_count']
-            packet['rain'] = float(rain_count) * self.rain_per_tip
+        if 'rain_tips' in data:
+            packet['rain'] = float(data['rain_tips']) * self.rain_per_tip
             if DEBUG_RAIN:
-                logdbg("rain=%s rain_count=%s last_rain_count=%s" %
-                       (packet['rain'], rain_count, self.last_rain_count))
+                logdbg("rain=%s rain_tips=%s rain_count=%s" %
+                       (packet['rain'], data['rain_tips'], data['rain_count']))
         elif len(packet) <= 1:
             # No data found
-            dbg_parse(3, "skip packet for data: %s" % data)
+            dbg_parse(3, "skip packet for data: %s", data)
             return None
-        packet['dateTime'] = int(time.time() + 0.5)
-        packet['usUnits'] = weewx.METRICWX
+        # the packet is stamped with the arrival of the data, not the time
+        # it was processed
+        now = self.clock.time()
+        if 'arrival' in data:
+            now -= self.clock.monotonic() - data['arrival']
+        if self.deadband is not None:
+            self.deadband.apply(packet, now)
+            if not packet:
+                dbg_parse(3, "skip unchanged packet for data: %s", data)
+                return None
+        packet['dateTime'] = int(now + 0.5)
+        packet['usUnits'] = self.units.unit_system
         return packet
 
+    def _update_rain_stats(self, data):
+        if data['channel'] != self.station.channels['iss']:
+            return
+        stats = self.rain_stats
+        now = data.get('arrival', self.clock.monotonic())
+        if 'rain_count' in data:
+            data['rain_tips'] = stats.add_count(now, data['rain_count'])
+        if self.rain_statistics:
+            if 'rain_rate' in data:
+                stats.add_rate(now, data['rain_rate'])
+            data.update(stats.values(now))
+
+    def _update_wind_stats(self, data):
+        # only the frames of the wind channel carry the wind statistics
+        if data.get('channel') != self.station.channels['wind_channel']:
+            return
+        stats = self.wind_stats
+        now = data.get('arrival', self.clock.monotonic())
+        if 'wind_speed' in data:
+            stats.add(now, data['wind_speed'], data['wind_dir'])
+            # the gust of a loop packet is its own sample; the archive
+            # record gets the maximum of its interval from weewx
+            data['wind_gust'] = data['wind_speed']
+            data['wind_gust_dir'] = data['wind_dir']
+        if 'wind_gust_10_tx' in data and \
+                not stats.check_gust(now, data['wind_gust_10_tx']):
+            logdbg("wind gust %s differs from transmitter gust %s" %
+                   (stats.gusts[0][1] if stats.gusts else None,
+                    data['wind_gust_10_tx']))
+        data.update(stats.values(now))
+
     def _init_rf_stats(self):
         self.rf_stats = {
             'min': [0] * self.NUM_CHAN, # rf sensitivity has negative values
@@ -359,7 +2674,7 @@ class MeteostickDriver(weewx.drivers.AbstractDevice, weewx.engine.StdService):
             'avg': [0] * self.NUM_CHAN,
             'missed': [0] * self.NUM_CHAN,
             'pctgood': [None] * self.NUM_CHAN,
-            'ts': int(time.time())}
+            'ts': int(self.clock.time())}
         # unlike the rf sensitivity measures, pct_good is positive
 
     def _update_rf_stats(self, ch, signal, missed):
@@ -370,6 +2685,29 @@ class MeteostickDriver(weewx.drivers.AbstractDevice, weewx.engine.StdService):
         self.rf_stats['cnt'][ch] += 1
         self.rf_stats['last'][ch] = signal
         self.rf_stats['missed'][ch] += missed
+        self.rf_quality.update(ch, signal, missed, self.clock.time())
+
+    def _tune_rf(self, data):
+        tuner = self.rf_tuner
+        if 'channel' in data:
+            tuner.update(data['channel'], data['rf_signal'], data['rf_missed'])
+        rfs = tuner.step(self.clock.time(), self.station.rfs,
+                         self.station.errors['crc'])
+        if rfs is not None:
+            # applied between two frames, without a reset
+            self.station.queue_setting('rf_sensitivity', rfs)
+
+    def get_rf_quality(self, ch):
+        """Reception quality of a channel: pct-good over the last 1, 5 and
+        15 minutes, and percentiles of the rf signal in dB."""
+        now = self.clock.time()
+        return {'pct_good_1m': self.rf_quality.pct_good(ch, 1, now),
+                'pct_good_5m': self.rf_quality.pct_good(ch, 5, now),
+                'pct_good_15m': self.rf_quality.pct_good(ch, 15, now),
+                'signal_p5': self.rf_quality.percentile(ch, 5),
+                'signal_p50': self.rf_quality.percentile(ch, 50),
+                'signal_p95': self.rf_quality.percentile(ch, 95),
+                'count': self.rf_quality.cnt[ch]}
 
     def _update_rf_summaries(self):
         # Update the summary stats, skip channels that do not matter.
@@ -394,13 +2732,13 @@ class MeteostickDriver(weewx.drivers.AbstractDevice, weewx.engine.StdService):
         logdbg("RF summary: rf_sensitivity=%s (values in dB)" %
                self.station.rfs)
         logdbg("Station           max   min   avg   last  count [missed] [good]")
-        for x in [('iss', self.station.channels['iss']),
-                  ('wind', self.station.channels['anemometer']),
-                  ('leaf_soil', self.station.channels['leaf_soil']),
-                  ('temp_hum_1', self.station.channels['temp_hum_1']),
-                  ('temp_hum_2', self.station.channels['temp_hum_2'])]:
-            if x[1] != 0:
-                self._report_channel(x[0], x[1])
+        for tx in self.station.registry:
+            if tx is not None:
+                self._report_channel(tx.label, tx.channel)
+        scheduler = self.station.scheduler
+        for ch in sorted(scheduler.period):
+            logdbg("channel %s: missed %s since startup, jitter %.3f s" %
+                   (ch, scheduler.missed[ch], scheduler.jitter[ch]))
 
     def _report_channel(self, label, ch):
         if self.rf_stats['pctgood'][ch] is None \
@@ -419,39 +2757,136 @@ class MeteostickDriver(weewx.drivers.AbstractDevice, weewx.engine.StdService):
                 self.rf_stats['pctgood'][ch],
                 msg))
 
+    def _store_rf_stats(self, ts):
+        stats = self.rf_stats
+        rows = []
+        for tx in self.station.registry:
+            if tx is None:
+                continue
+            ch = tx.channel
+            received = stats['cnt'][ch] > 0
+            rows.append({
+                'dateTime': ts, 'channel': ch, 'label': tx.label.strip(),
+                'interval': ts - stats['ts'],
+                'rf_sensitivity': self.station.rfs,
+                'count': stats['cnt'][ch], 'missed': stats['missed'][ch],
+                'pct_good': stats['pctgood'][ch],
+                'min_signal': stats['min'][ch] if received else None,
+                'max_signal': stats['max'][ch] if received else None,
+                'avg_signal': stats['avg'][ch] if received else None,
+                'last_signal': stats['last'][ch] if received else None})
+        self.rf_store.add(rows)
+
     def new_archive_record(self, event):
         self._update_rf_summaries()  # calculate rf summaries
         # Do not store first results after startup; the data are not complete
         if not self.first_rf_stats:
             event.record['rxCheckPercent'] = self.rf_stats['pctgood'][self.station.channels['iss']]
             logdbg("data['rxCheckPercent']: %s" % event.record['rxCheckPercent'])
+            if self.rf_store is not None:
+                self._store_rf_stats(event.record['dateTime'])
         self.first_rf_stats = False
         if DEBUG_RFS:
             self._report_rf_stats()
+        if self.deadband is not None:
+            logdbg("deadband suppressed %s fields: %s" %
+                   (self.deadband.suppressed_count, self.deadband.suppressed))
+        logdbg("rejected %s messages, skipped decoding of %s" %
+               (self.station.rejected, self.station.skipped))
+        if self.timer is not None:
+            self._report_timing()
+        logdbg("latency from arrival to yield (us): %s; backlog %s" %
+               (self.latency.summary(), self.station.backlog))
         self._init_rf_stats()  # flush rf statistics
 
 
 class Meteostick(object):
     DEFAULT_PORT = '/dev/ttyUSB0'
+    DEFAULT_PORT_CACHE = '/var/tmp/meteostick-port'
     DEFAULT_BAUDRATE = 115200
     DEFAULT_FREQUENCY = 'EU'
     DEFAULT_RF_SENSITIVITY = 90
     MAX_RF_SENSITIVITY = 125
-
-    def __init__(self, **cfg):
+    RESPONSE_WAIT = 1.0  # seconds in which a command is answered
+    MAX_PARTIAL_TIMEOUTS = 3  # timeouts after which a cut-off line is dropped
+    CHANNEL_NAMES = ['iss', 'anemometer', 'leaf_soil', 'temp_hum_1',
+                     'temp_hum_2']
+
+    def __init__(self, clock=SYSTEM_CLOCK, connection=None, **cfg):
+        self.clock = clock
+        self.serial_port_name = None
+        # read from this port-like object instead of the serial port
+        self.connection = connection
         self.port = cfg.get('port', self.DEFAULT_PORT)
-        loginf('using serial port %s' % self.port)
+        # with port = auto the port is discovered when it is opened
+        patterns = cfg.get('port_patterns')
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        self.port_patterns = patterns
+        self.port_cache = cfg.get('port_cache', self.DEFAULT_PORT_CACHE)
+        self.probe_timeout = float(cfg.get('probe_timeout', 3.0))
+        # read from the broker of another process instead of the serial port
+        self.broker = cfg.get('broker')
+        if self.broker is not None:
+            loginf('using broker %s' % self.broker)
+        else:
+            loginf('using serial port %s' % self.port)
 
         self.baudrate = cfg.get('baudrate', self.DEFAULT_BAUDRATE)
         loginf('using baudrate %s' % self.baudrate)
 
-        freq = cfg.get('transceiver_frequency', self.DEFAULT_FREQUENCY)
+        self._set_frequency(
+            cfg.get('transceiver_frequency', self.DEFAULT_FREQUENCY))
+        self._set_rf_sensitivity(
+            cfg.get('rf_sensitivity', self.DEFAULT_RF_SENSITIVITY))
+        self.repeater = int(cfg.get('repeater', 1))
+
+        channels = dict()
+        for name in self.CHANNEL_NAMES:
+            channels[name] = int(cfg.get(name + '_channel',
+                                         1 if name == 'iss' else 0))
+        # the fields to decode, see set_needed
+        self.needed = None
+        # the unit system of the decoded values, set by the driver
+        self.units = METRICWX_UNITS
+
+        # additional transmitters by channel, e.g. {'3': 'temp_hum'}
+        self.extra_transmitters = dict(
+            (int(ch), kind)
+            for ch, kind in cfg.get('extra_transmitters', {}).items())
+        self._set_channels(channels)
+
+        # settings to apply between frames, see queue_setting
+        self.settings = collections.deque()
+
+        self.timeout = 3 # seconds
+        self.serial_port = None
+        self.frame = Frame()  # reused for each raw message
+        self.timer = None  # StageTimer of the read and parse stages
+        self.partial = ''  # start of a line that was cut off by a timeout
+        self.partial_timeouts = 0  # timeouts since the partial line was read
+        self.response_due = None  # monotonic time a command response is due
+        self.arrival = None  # monotonic time the last line was read
+        self.backlog = 0  # number of lines read while more data was waiting
+        self.frames = dict()  # count per (channel, message type)
+        self.errors = {'crc': 0, 'format': 0, 'unprintable': 0}
+        self.rejected = 0  # messages of unknown transmitters
+        self.skipped = dict()  # message type: messages not decoded
+        self.read_retries = 0
+        self.read_timeouts = 0
+
+        self.adaptive_timeout = weeutil.weeutil.to_bool(
+            cfg.get('adaptive_timeout', False))
+        loginf('using adaptive_timeout %s' % self.adaptive_timeout)
+
+    def _set_frequency(self, freq):
         if freq not in ['EU', 'US', 'AU']:
             raise ValueError("invalid frequency %s" % freq)
         self.frequency = freq
         loginf('using frequency %s' % self.frequency)
 
-        rfs = int(cfg.get('rf_sensitivity', self.DEFAULT_RF_SENSITIVITY))
+    def _set_rf_sensitivity(self, value):
+        rfs = int(value)
         absrfs = abs(rfs)
         if absrfs > self.MAX_RF_SENSITIVITY:
             raise ValueError("invalid RF sensitivity %s" % rfs)
@@ -459,12 +2894,13 @@ class Meteostick(object):
         self.rf_threshold = absrfs * 2
         loginf('using rf sensitivity %s (-%s dB)' % (rfs, absrfs))
 
-        channels = dict()
-        channels['iss'] = int(cfg.get('iss_channel', 1))
-        channels['anemometer'] = int(cfg.get('anemometer_channel', 0))
-        channels['leaf_soil'] = int(cfg.get('leaf_soil_channel', 0))
-        channels['temp_hum_1'] = int(cfg.get('temp_hum_1_channel', 0))
-        channels['temp_hum_2'] = int(cfg.get('temp_hum_2_channel', 0))
+    def _set_channels(self, channels):
+        for name in self.CHANNEL_NAMES:
+            low = 1 if name == 'iss' else 0
+            if not low <= channels[name] <= 8:
+                raise ValueError("invalid %s_channel %s" %
+                                 (name, channels[name]))
+        channels = dict(channels)
         if channels['anemometer'] == 0:
             channels['wind_channel'] = channels['iss']
         else:
@@ -476,37 +2912,80 @@ class Meteostick(object):
         loginf('using temp_hum_1_channel %s' % channels['temp_hum_1'])
         loginf('using temp_hum_2_channel %s' % channels['temp_hum_2'])
 
-        self.transmitters = Meteostick.ch_to_xmit(
-            channels['iss'], channels['anemometer'], channels['leaf_soil'],
-            channels['temp_hum_1'], channels['temp_hum_2'])
+        self.registry = make_registry(channels, self.extra_transmitters)
+        for tx in self.registry:
+            if tx is not None:
+                tx.set_needed(self.needed)
+        used = [tx.channel for tx in self.registry if tx is not None]
+        for ch, kind in sorted(self.extra_transmitters.items()):
+            loginf('using %s on channel %s' % (kind, ch))
+
+        self.transmitters = Meteostick.ch_to_xmit(*used)
         loginf('using transmitters %02x' % self.transmitters)
 
-        self.timeout = 3 # seconds
-        self.serial_port = None
+        self.scheduler = ArrivalScheduler(used)
+
+    def set_needed(self, fields):
+        """Decode only the messages that carry one of the given fields of
+        the data.  With fields None every message is decoded."""
+        self.needed = None if fields is None else frozenset(fields)
+        for tx in self.registry:
+            if tx is not None:
+                tx.set_needed(self.needed)
+
+    def queue_setting(self, name, value):
+        """Queue a change of a setting of the running meteostick.  The
+        setting is checked right away and applied between two frames by
+        the read loop.  This may be called from another thread."""
+        if self.broker is not None:
+            raise ValueError("settings cannot be changed through the broker")
+        if name == 'rf_sensitivity':
+            value = int(value)
+            if abs(value) > self.MAX_RF_SENSITIVITY:
+                raise ValueError("invalid RF sensitivity %s" % value)
+        elif name == 'transceiver_frequency':
+            if value not in ['EU', 'US', 'AU']:
+                raise ValueError("invalid frequency %s" % value)
+        elif name == 'repeater':
+            value = int(value)
+            if not 0 <= value <= 255:
+                raise ValueError("invalid repeater %s" % value)
+        elif name.endswith('_channel') and name[:-8] in self.CHANNEL_NAMES:
+            value = int(value)
+            if not (1 if name == 'iss_channel' else 0) <= value <= 8:
+                raise ValueError("invalid %s %s" % (name, value))
+        else:
+            raise ValueError("unknown setting %s" % name)
+        self.settings.append((name, value))
+
+    def apply_settings(self):
+        """Apply the queued settings and send them to the meteostick."""
+        while self.settings:
+            name, value = self.settings.popleft()
+            loginf("apply setting %s=%s" % (name, value))
+            if name == 'rf_sensitivity':
+                self._set_rf_sensitivity(value)
+                self.send_setting('x' + str(self.rf_threshold))
+            elif name == 'transceiver_frequency':
+                self._set_frequency(value)
+                self.send_setting(self._frequency_command())
+            elif name == 'repeater':
+                self.repeater = value
+                self.send_setting('r' + str(self.repeater))
+            else:
+                channels = dict(self.channels)
+                channels[name[:-8]] = value
+                self._set_channels(channels)
+                self.send_setting('t' + str(self.transmitters))
 
     @staticmethod
-    def ch_to_xmit(iss_channel, anemometer_channel, leaf_soil_channel,
-                   temp_hum_1_channel, temp_hum_2_channel):
+    def ch_to_xmit(*channels):
         transmitters = 0
-        transmitters += 1 << (iss_channel - 1)
-        if anemometer_channel != 0:
-            transmitters += 1 << (anemometer_channel - 1)
-        if leaf_soil_channel != 0:
-            transmitters += 1 << (leaf_soil_channel - 1)
-        if temp_hum_1_channel != 0:
-            transmitters += 1 << (temp_hum_1_channel - 1)
-        if temp_hum_2_channel != 0:
-            transmitters += 1 << (temp_hum_2_channel - 1)
+        for ch in channels:
+            if ch != 0:
+                transmitters |= 1 << (ch - 1)
         return transmitters
 
-    @staticmethod
-    def _check_crc(msg, chksum):
-        crc_result = crc16(msg)
-        if crc_result != chksum:
-            logerr('CRC result is 0x%04x, should be 0x%04x' %
-                          (crc_result, chksum))
-            raise ValueError("CRC error")
-
     def __enter__(self):
         self.open()
         return self
@@ -515,21 +2994,77 @@ class Meteostick(object):
         self.close()
 
     def open(self):
-        dbg_serial(1, "open serial port %s" % self.port)
-        self.serial_port = serial.Serial(self.port, self.baudrate,
+        if self.connection is not None:
+            self.serial_port = self.connection
+            return
+        if self.broker is not None:
+            self.serial_port = BrokerConnection(self.broker, self.timeout)
+            return
+        port = self.port
+        if port == 'auto':
+            port = discover_port(self.port_patterns, self.baudrate,
+                                 self.probe_timeout, self.port_cache)
+            if port is None:
+                raise weewx.WakeupError("No meteostick found on %s" %
+                                        (self.port_patterns or
+                                         DISCOVERY_PATTERNS))
+        self.serial_port_name = port
+        dbg_serial(1, "open serial port %s", port)
+        self.serial_port = serial.Serial(port, self.baudrate,
                                          timeout=self.timeout)
 
     def close(self):
         if self.serial_port is not None:
-            dbg_serial(1, "close serial port %s" % self.port)
+            dbg_serial(1, "close serial port %s", self.serial_port_name)
             self.serial_port.close()
             self.serial_port = None
 
     def get_readings(self):
-        buf = self.serial_port.readline().decode('utf-8')
-        if len(buf) > 0:
-            dbg_serial(2, "station said: %s" %
+        if self.settings:
+            self.apply_settings()
+        if self.adaptive_timeout:
+            # wait no longer than until the next message is due
+            timeout = self.scheduler.next_timeout(self.clock.monotonic(),
+                                                  self.timeout)
+            if abs(timeout - self.serial_port.timeout) > 0.05:
+                self.serial_port.timeout = timeout
+        timer = self.timer
+        if timer is not None:
+            t0 = _monotonic()
+        buf = self.serial_port.readline()
+        if timer is not None:
+            t1 = _monotonic()
+            timer.record('read', t1 - t0)
+        buf = buf.decode('utf-8')
+        if timer is not None:
+            timer.record('decode', _monotonic() - t1)
+        if len(buf) > 0 and DEBUG_SERIAL >= 2:
+            dbg_serial(2, "station said: %s",
                        ' '.join(["%0.2X" % ord(c) for c in buf]))
+        if not buf:
+            self.read_timeouts += 1
+            if self.partial:
+                # keep the start of the line for the read that completes it,
+                # unless the rest of the line does not come
+                self.partial_timeouts += 1
+                if self.partial_timeouts >= self.MAX_PARTIAL_TIMEOUTS:
+                    dbg_serial(1, "drop partial line '%s'", self.partial)
+                    self.partial = ''
+                    self.partial_timeouts = 0
+            return ''
+        if not buf.endswith('\n'):
+            # the read timed out in the middle of a line
+            self.partial += buf
+            return ''
+        if self.partial:
+            buf = self.partial + buf
+            self.partial = ''
+            self.partial_timeouts = 0
+        self.arrival = self.clock.monotonic()
+        if self.serial_port.inWaiting() > 0:
+            # the reader is behind, so the arrival is later than the
+            # actual reception of the line
+            self.backlog += 1
         return buf.strip()
 
     def get_readings_with_retry(self, max_tries=5, retry_wait=10):
@@ -539,7 +3074,8 @@ class Meteostick(object):
             except serial.serialutil.SerialException as e:
                 loginf("Failed attempt %d of %d to get readings: %s" %
                        (ntries + 1, max_tries, e))
-                time.sleep(retry_wait)
+                self.read_retries += 1
+                self.clock.sleep(retry_wait)
         else:
             msg = "Max retries (%d) exceeded for readings" % max_tries
             logerr(msg)
@@ -555,23 +3091,23 @@ class Meteostick(object):
         # Send a reset command
         self.serial_port.write(b'r\n')
         # Wait until we see the ? character
-        start_ts = time.time()
+        start_ts = self.clock.time()
         ready = False
         response = ''
         while not ready:
-            time.sleep(0.1)
+            self.clock.sleep(0.1)
             while self.serial_port.inWaiting() > 0:
                 c = self.serial_port.read(1).decode('utf-8')
                 if c == '?':
                     ready = True
                 elif c in string.printable:
                     response += c
-            if time.time() - start_ts > max_wait:
+            if self.clock.time() - start_ts > max_wait:
                 raise weewx.WakeupError("No 'ready' response from meteostick after %s seconds" % max_wait)
         loginf("reset: %s" % response.split('\n')[0])
-        dbg_serial(2, "full response to reset: %s" % response)
+        dbg_serial(2, "full response to reset: %s", response)
         # Discard any serial input from the device
-        time.sleep(0.2)
+        self.clock.sleep(0.2)
         self.serial_port.flushInput()
         return response
 
@@ -592,61 +3128,102 @@ class Meteostick(object):
         self.send_command('f1')
 
         # Listen to configured repeaters
-        self.send_command('r1')     # repeater 1  
+        self.send_command('r' + str(self.repeater))
 
         # Set device to produce 10-bytes raw data
         command = 'o3'
         self.send_command(command)
 
         # Set the frequency. Valid frequencies are US, EU and AU
+        self.send_command(self._frequency_command())
+
+        # From now on the device will produce lines with received data
+
+    def _frequency_command(self):
         command = 'm0' # default to US
         if self.frequency == 'AU':
             command = 'm2'
         elif self.frequency == 'EU':
             command = 'm1'
-        self.send_command(command)
+        return command
 
-        # From now on the device will produce lines with received data
+    def send_setting(self, cmd):
+        """Send a command to the meteostick while it is sending data.
+        Unlike send_command nothing is waited for or flushed, so the frames
+        that arrive meanwhile and a line that is partly read are kept.  The
+        response of the meteostick is read by the read loop."""
+        self.serial_port.write((cmd + "\r").encode('utf-8'))
+        self.response_due = self.clock.monotonic() + self.RESPONSE_WAIT
+        dbg_serial(1, "cmd: '%s'", cmd)
 
     def send_command(self, cmd):
         cmd2 = (cmd + "\r").encode('utf-8')
         self.serial_port.write(cmd2)
-        time.sleep(0.2)
+        self.clock.sleep(0.2)
         response = self.serial_port.read(self.serial_port.inWaiting()).decode('utf-8')
-        dbg_serial(1, "cmd: '%s': %s" % (cmd, response))
+        dbg_serial(1, "cmd: '%s': %s", (cmd, response))
         self.serial_port.flushInput()
+        return response
 
     @staticmethod
     def get_parts(raw):
-        dbg_parse(1, "readings: %s" % raw)
+        dbg_parse(1, "readings: %s", raw)
         parts = raw.split(' ')
-        dbg_parse(3, "parts: %s (%s)" % (parts, len(parts)))
+        dbg_parse(3, "parts: %s (%s)", (parts, len(parts)))
         if len(parts) < 2:
             raise ValueError("not enough parts in '%s'" % raw)
         return parts
 
     def parse_readings(self, raw, rain_per_tip):
         data = dict()
+        now = self.clock.monotonic()
+        missed = self.scheduler.check(now)
+        if missed:
+            dbg_parse(2, "missed messages of channels %s", (missed,))
         if not raw:
             return data
+        if self.response_due is not None:
+            if now > self.response_due:
+                self.response_due = None
+            elif raw[0] not in 'IB':
+                loginf("response to command: %s" % raw)
+                return data
         if not all(c in string.printable for c in raw):
             logerr("unprintable characters in readings: %s" % _fmt(raw))
+            self.errors['unprintable'] += 1
             return data
         try:
-            data = self.parse_raw(raw,
-                                  self.channels['iss'],
-                                  self.channels['anemometer'],
-                                  self.channels['leaf_soil'],
-                                  self.channels['temp_hum_1'],
-                                  self.channels['temp_hum_2'],
-                                  rain_per_tip)
+            data = self.parse_raw(raw, self.registry, rain_per_tip,
+                                  self.frame, self.units, self.timer)
+            if raw[0] == 'I' and self.frame.skipped is not None:
+                if self.frame.skipped == 'channel':
+                    self.rejected += 1
+                else:
+                    message_type = self.frame.message_type
+                    self.skipped[message_type] = \
+                        self.skipped.get(message_type, 0) + 1
 
+        except CRCError as e:
+            logerr("parse failed for '%s': %s" % (raw, e))
+            self.errors['crc'] += 1
         except ValueError as e:
             logerr("parse failed for '%s': %s" % (raw, e))
+            self.errors['format'] += 1
+        if data:
+            if raw[0] == 'I':
+                key = (self.frame.channel, self.frame.message_type)
+            else:
+                key = (RAW_CHANNEL, raw[0])
+            self.frames[key] = self.frames.get(key, 0) + 1
+            # the arrival of the line at the serial port
+            data['arrival'] = self.arrival if self.arrival is not None else now
+            if data.get('channel', RAW_CHANNEL) != RAW_CHANNEL:
+                self.scheduler.arrival(data['channel'], data['arrival'])
         return data
 
     @staticmethod
-    def parse_raw(raw, iss_ch, wind_ch, ls_ch, th1_ch, th2_ch, rain_per_tip):
+    def parse_raw(raw, registry, rain_per_tip, frame=None,
+                  units=METRICWX_UNITS, timer=None):
         data = dict()
         parts = Meteostick.get_parts(raw)
         n = len(parts)
@@ -657,8 +3234,8 @@ class Meteostick(object):
             data['rf_signal'] = 0  # not available
             data['rf_missed'] = 0  # not available
             if n >= 6:
-                data['temp_in'] = float(parts[3]) / 10.0 # C
-                data['pressure'] = float(parts[4]) / 100.0 # hPa
+                data['temp_in'] = units.temp(float(parts[3]) / 10.0) # C
+                data['pressure'] = units.pressure(float(parts[4]) / 100.0) # hPa
                 if n > 7:
                     # only with custom receiver
                     data['humidity_in'] = float(parts[7])
@@ -670,52 +3247,39 @@ class Meteostick(object):
             # message example:
             #       ---- raw message ----  rfs ts_last
             # I 102 51 0 DB FF 73 0 11 41  -65 5249944 202
-            raw_msg = [0] * 10
-            for i in range(0, 10):
-                raw_msg[i] = parts[i + 2]
-            pkt = bytearray([int(i, base=16) for i in raw_msg])
-
-            # perform crc-check
-            raw_msg_crc = [0] * 8
-            if pkt[8] == 0xFF and pkt[9] == 0xFF:
-                # message received from davis equipment
-                # Calculate crc with bytes 0-7, result must be equal to 0
-                chksum = 0
-                for i in range(0, 8):
-                    raw_msg_crc[i] = chr(int(parts[i + 2], 16))
-                Meteostick._check_crc(raw_msg_crc, chksum)
+            if frame is None:
+                frame = Frame()
+            frame.skipped = None
+            if n > 2 and registry[(int(parts[2], 16) & 0x7) + 1] is None:
+                # reject messages of unknown transmitters by the header,
+                # before the message is decoded and its crc is checked
+                frame.skipped = 'channel'
+                logerr("unknown station with channel: %s, raw message: %s" %
+                       ((int(parts[2], 16) & 0x7) + 1, raw))
+                return data
+            frame.load(parts)
+            if timer is not None:
+                t0 = _monotonic()
+                frame.check_crc()
+                timer.record('crc', _monotonic() - t0)
             else:
-                # message received via repeater
-                # Calculate crc with bytes 0-5 and 8-9, result must be equal
-                # to bytes 6-7
-                chksum = (pkt[6] << 8) + pkt[7]
-                for i in range(0, 6):
-                    raw_msg_crc[i] = chr(int(parts[i + 2], 16))
-                for i in range(6, 8):
-                    raw_msg_crc[i] = chr(int(parts[i + 4], 16))
-                Meteostick._check_crc(raw_msg_crc, chksum)
-
-            data['channel'] = (pkt[0] & 0x7) + 1
-            battery_low = (pkt[0] >> 3) & 0x1
-            data['rf_signal'] = int(parts[13])
-            time_since_last = int(parts[14])
+                frame.check_crc()
+            pkt = frame.pkt
+
+            data['channel'] = frame.channel
+            battery_low = frame.battery_low
+            data['rf_signal'] = frame.rf_signal
+            time_since_last = frame.time_since_last
             # the cyclus time varies from 2.5 to 3 seconds for channels 1 to 8
             # simplifiy calculation with max cyclus time of 3.0 seconds
             data['rf_missed'] = (time_since_last // 2500000) - 1
             if data['rf_missed'] > 0:
-                dbg_parse(3, "channel %s missed %s" %
+                dbg_parse(3, "channel %s missed %s",
                           (data['channel'], data['rf_missed']))
 
-            if data['channel'] == iss_ch or data['channel'] == wind_ch \
-                    or data['channel'] == th1_ch or data['channel'] == th2_ch:
-                if data['channel'] == iss_ch:
-                    data['bat_iss'] = battery_low
-                elif data['channel'] == wind_ch:
-                    data['bat_anemometer'] = battery_low
-                elif data['channel'] == th1_ch:
-                    data['bat_th_1'] = battery_low
-                else:
-                    data['bat_th_2'] = battery_low
+            tx = registry[frame.channel]
+            if tx.kind != 'leaf_soil':
+                data[tx.battery] = battery_low
                 # Each data packet of iss or anemometer contains wind info,
                 # but it is only valid when received from the channel with
                 # the anemometer connected
@@ -724,7 +3288,8 @@ class Meteostick(object):
                 # I 101 E0 0 0 4E 5 0 72 61  -68 2562440 68 (no sensor)
                 wind_speed_raw = pkt[1]
                 wind_dir_raw = pkt[2]
-                if not(wind_speed_raw == 0 and wind_dir_raw == 0):
+                if not(wind_speed_raw == 0 and wind_dir_raw == 0) \
+                        and 'wind' not in tx.skip:
                     """ The elder Vantage Pro and Pro2 stations measured
                     the wind direction with a potentiometer. This type has
                     a fairly big dead band around the North. The Vantage
@@ -736,7 +3301,7 @@ class Meteostick(object):
                     For now we use the traditional 'pro' formula for all
                     wind directions.
                     """
-                    dbg_parse(3, "wind_speed_raw=%03x wind_dir_raw=0x%03x" %
+                    dbg_parse(3, "wind_speed_raw=%03x wind_dir_raw=0x%03x",
                               (wind_speed_raw, wind_dir_raw))
 
                     # Vantage Pro and Pro2
@@ -751,13 +3316,17 @@ class Meteostick(object):
                     wind_dir_vue = wind_dir_raw * 1.40625 + 0.3
 
                     # wind error correction is by raw byte values
+                    if timer is not None:
+                        t0 = _monotonic()
                     wind_speed_ec = round(Meteostick.calc_wind_speed_ec(wind_speed_raw, wind_dir_raw))
+                    if timer is not None:
+                        timer.record('wind', _monotonic() - t0)
 
                     data['wind_speed_ec'] = wind_speed_ec
                     data['wind_speed_raw'] = wind_speed_raw
                     data['wind_dir'] = wind_dir_pro
-                    data['wind_speed'] = wind_speed_ec * MPH_TO_MPS
-                    dbg_parse(3, "WS=%s WD=%s WS_raw=%s WS_ec=%s WD_raw=%s WD_pro=%s WD_vue=%s" %
+                    data['wind_speed'] = wind_speed_ec * units.mph
+                    dbg_parse(3, "WS=%s WD=%s WS_raw=%s WS_ec=%s WD_raw=%s WD_pro=%s WD_vue=%s",
                               (data['wind_speed'], data['wind_dir'],
                                wind_speed_raw, wind_speed_ec,
                                wind_dir_raw if wind_dir_raw <= 180 else 360 - wind_dir_raw,
@@ -765,8 +3334,11 @@ class Meteostick(object):
 
                 # data from both iss sensors and extra sensors on
                 # Anemometer Transport Kit
-                message_type = (pkt[0] >> 4 & 0xF)
-                if message_type == 2:
+                message_type = frame.message_type
+                if message_type in tx.skip:
+                    # none of the fields of this message is used
+                    frame.skipped = 'message'
+                elif message_type == 2:
                     # supercap voltage (Vue only) max: 0x3FF (1023)
                     # message example:
                     # I 103 20 4 C3 D4 C1 81 89 EE  -77 2562520 -70
@@ -777,7 +3349,7 @@ class Meteostick(object):
                     supercap_volt_raw = ((pkt[3] << 2) + (pkt[4] >> 6)) & 0x3FF
                     if supercap_volt_raw != 0x3FF:
                         data['supercap_volt'] = supercap_volt_raw / 300.0
-                        dbg_parse(3, "supercap_volt_raw=0x%03x value=%s" %
+                        dbg_parse(3, "supercap_volt_raw=0x%03x value=%s",
                                   (supercap_volt_raw, data['supercap_volt']))
                 elif message_type == 3:
                     # unknown message type
@@ -785,8 +3357,8 @@ class Meteostick(object):
                     # TODO
                     # TODO (no sensor)
                     dbg_parse(1, "unknown message with type=0x03; "
-                              "pkt[3]=0x%02x pkt[4]=0x%02x pkt[5]=0x%02x"
-                              % (pkt[3], pkt[4], pkt[5]))
+                              "pkt[3]=0x%02x pkt[4]=0x%02x pkt[5]=0x%02x",
+                              (pkt[3], pkt[4], pkt[5]))
                 elif message_type == 4:
                     # uv
                     # message examples:
@@ -795,7 +3367,7 @@ class Meteostick(object):
                     uv_raw = ((pkt[3] << 2) + (pkt[4] >> 6)) & 0x3FF
                     if uv_raw != 0x3FF:
                         data['uv'] = uv_raw / 50.0
-                        dbg_parse(3, "uv_raw=%04x value=%s" %
+                        dbg_parse(3, "uv_raw=%04x value=%s",
                                   (uv_raw, data['uv']))
                 elif message_type == 5:
                     # rain rate
@@ -811,27 +3383,27 @@ class Meteostick(object):
                     """
                     # typical time between tips: 64-1022
                     time_between_tips_raw = ((pkt[4] & 0x30) << 4) + pkt[3]
-                    dbg_parse(3, "time_between_tips_raw=%03x (%s)" %
+                    dbg_parse(3, "time_between_tips_raw=%03x (%s)",
                               (time_between_tips_raw, time_between_tips_raw))
-                    if data['channel'] == iss_ch: # rain sensor is present
+                    if tx.kind == 'iss': # rain sensor is present
                         rain_rate = None
                         if time_between_tips_raw == 0x3FF:
                             # no rain
                             rain_rate = 0
-                            dbg_parse(3, "no_rain=%s mm/h" % rain_rate)
+                            dbg_parse(3, "no_rain=%s mm/h", rain_rate)
                         elif pkt[4] & 0x40 == 0:
                             # heavy rain. typical value:
                             # 64/16 - 1020/16 = 4 - 63.8 (180.0 - 11.1 mm/h)
                             time_between_tips = time_between_tips_raw / 16.0
                             rain_rate = 3600.0 / time_between_tips * rain_per_tip
-                            dbg_parse(3, "heavy_rain=%s mm/h, time_between_tips=%s s" %
+                            dbg_parse(3, "heavy_rain=%s mm/h, time_between_tips=%s s",
                                       (rain_rate, time_between_tips))
                         else:
                             # light rain. typical value:
                             # 64 - 1022 (11.1 - 0.8 mm/h)
                             time_between_tips = time_between_tips_raw
                             rain_rate = 3600.0 / time_between_tips * rain_per_tip
-                            dbg_parse(3, "light_rain=%s mm/h, time_between_tips=%s s" %
+                            dbg_parse(3, "light_rain=%s mm/h, time_between_tips=%s s",
                                       (rain_rate, time_between_tips))
                         data['rain_rate'] = rain_rate
                 elif message_type == 6:
@@ -842,8 +3414,8 @@ class Meteostick(object):
                     sr_raw = ((pkt[3] << 2) + (pkt[4] >> 6)) & 0x3FF
                     if sr_raw < 0x3FE:
                         data['solar_radiation'] = sr_raw * 1.757936
-                        dbg_parse(3, "solar_radiation_raw=0x%04x value=%s"
-                                  % (sr_raw, data['solar_radiation']))
+                        dbg_parse(3, "solar_radiation_raw=0x%04x value=%s",
+                                  (sr_raw, data['solar_radiation']))
                 elif message_type == 7:
                     # solar cell output / solar power (Vue only)
                     # message example:
@@ -855,8 +3427,8 @@ class Meteostick(object):
                     solar_power_raw = ((pkt[3] << 2) + (pkt[4] >> 6)) & 0x3FF
                     if solar_power_raw != 0x3FF:
                         data['solar_power'] = solar_power_raw / 300.0
-                        dbg_parse(3, "solar_power_raw=0x%03x solar_power=%s"
-                                  % (solar_power_raw, data['solar_power']))
+                        dbg_parse(3, "solar_power_raw=0x%03x solar_power=%s",
+                                  (solar_power_raw, data['solar_power']))
                 elif message_type == 8:
                     # outside temperature
                     # message examples:
@@ -869,27 +3441,18 @@ class Meteostick(object):
                     if temp_raw != 0xFFC and temp_raw != 0xFF8:
                         if pkt[4] & 0x8:
                             # digital temp sensor - value is twos-complement
-                            if pkt[3] & 0x80 != 0:
-                                temp_f = -(temp_raw ^ 0xFFF) / 10.0
-                            else:
-                                temp_f = temp_raw / 10.0
-                            temp_c = weewx.wxformulas.FtoC(temp_f) # C
-                            dbg_parse(3, "digital temp_raw=0x%03x temp_f=%s temp_c=%s"
-                                      % (temp_raw, temp_f, temp_c))
+                            # 0.1 F, looked up in the target units
+                            temp = units.temp_f[temp_raw]
+                            dbg_parse(3, "digital temp_raw=0x%03x temp=%s",
+                                      (temp_raw, temp))
                         else:
                             # analog sensor (thermistor)
                             temp_raw /= 4  # 10-bits temp value
                             temp_c = calculate_thermistor_temp(temp_raw)
-                            dbg_parse(3, "thermistor temp_raw=0x%03x temp_c=%s"
-                                      % (temp_raw, temp_c))
-                        if data['channel'] == th1_ch:
-                            data['temp_1'] = temp_c
-                        elif data['channel'] == th2_ch:
-                            data['temp_2'] = temp_c
-                        elif data['channel'] == wind_ch:
-                            data['temp_3'] = temp_c
-                        else:
-                            data['temperature'] = temp_c
+                            dbg_parse(3, "thermistor temp_raw=0x%03x temp_c=%s",
+                                      (temp_raw, temp_c))
+                            temp = units.temp(temp_c)
+                        data[tx.temp] = temp
                 elif message_type == 9:
                     # 10-min average wind gust
                     # message examples:
@@ -898,10 +3461,12 @@ class Meteostick(object):
                     gust_raw = pkt[3]  # mph
                     gust_index_raw = pkt[5] >> 4
                     if not(gust_raw == 0 and gust_index_raw == 0):
-                        dbg_parse(3, "W10=%s gust_index_raw=%s" %
+                        dbg_parse(3, "W10=%s gust_index_raw=%s",
                                   (gust_raw, gust_index_raw))
-                        # don't store the 10-min gust data because there is no
-                        # field for it reserved in the standard wview schema
+                        # there is no field reserved for the 10-min gust in
+                        # the standard wview schema; it is used to check
+                        # the gust that the driver calculates itself
+                        data['wind_gust_10_tx'] = gust_raw * units.mph
                 elif message_type == 0xA:
                     # outside humidity
                     # message examples:
@@ -918,15 +3483,11 @@ class Meteostick(object):
                         else:
                             # analog sensor (pkt[4] & 0x0f == 0x5)
                             humidity = humidity_raw * -0.301 + 710.23
-                        if data['channel'] == th1_ch:
-                            data['humid_1'] = humidity
-                        elif data['channel'] == th2_ch:
-                            data['humid_2'] = humidity
-                        elif data['channel'] == wind_ch:
+                        if tx.humid is None:
                             loginf("Warning: humidity sensor of Anemometer Transmitter Kit not in sensor map: %s" % humidity)
                         else:
-                            data['humidity'] = humidity
-                        dbg_parse(3, "humidity_raw=0x%03x value=%s" %
+                            data[tx.humid] = humidity
+                        dbg_parse(3, "humidity_raw=0x%03x value=%s",
                                   (humidity_raw, humidity))
                 elif message_type == 0xC:
                     # unknown message
@@ -935,7 +3496,7 @@ class Meteostick(object):
                     # As we have seen after one day of received data
                     # pkt[3] and pkt[5] are always zero;
                     # pckt[4] has values 0-3 (ATK) or 5 (temp/hum)
-                    dbg_parse(3, "unknown pkt[3]=0x%02x pkt[4]=0x%02x pkt[5]=0x%02x" %
+                    dbg_parse(3, "unknown pkt[3]=0x%02x pkt[4]=0x%02x pkt[5]=0x%02x",
                               (pkt[3], pkt[4], pkt[5]))
                 elif message_type == 0xE:
                     # rain
@@ -950,17 +3511,19 @@ class Meteostick(object):
                     if rain_count_raw != 0x80:
                         rain_count = rain_count_raw & 0x7F  # skip high bit
                         data['rain_count'] = rain_count
-                        dbg_parse(3, "rain_count_raw=0x%02x value=%s" %
+                        dbg_parse(3, "rain_count_raw=0x%02x value=%s",
                                   (rain_count_raw, rain_count))
                 else:
                     # unknown message type
                     logerr("unknown message type 0x%01x" % message_type)
 
-            elif data['channel'] == ls_ch:
+            else:
                 # leaf and soil station
-                data['bat_leaf_soil'] = battery_low
+                data[tx.battery] = battery_low
                 data_type = pkt[0] >> 4
-                if data_type == 0xF:
+                if data_type == 0xF and (pkt[1] & 0x3) in tx.skip:
+                    frame.skipped = 'message'
+                elif data_type == 0xF:
                     data_subtype = pkt[1] & 0x3
                     sensor_num = ((pkt[1] & 0xe0) >> 5) + 1
                     temp_c = DEFAULT_SOIL_TEMP
@@ -975,8 +3538,8 @@ class Meteostick(object):
                         if pkt[3] != 0xFF:
                             # soil temperature
                             temp_c = calculate_thermistor_temp(temp_raw)
-                            data['soil_temp_%s' % sensor_num] = temp_c
-                            dbg_parse(3, "soil_temp_%s=%s 0x%03x" %
+                            data['soil_temp_%s%s' % (sensor_num, tx.suffix)] = units.temp(temp_c)
+                            dbg_parse(3, "soil_temp_%s=%s 0x%03x",
                                       (sensor_num, temp_c, temp_raw))
                         if pkt[2] != 0xFF:
                             # soil moisture potential
@@ -985,8 +3548,8 @@ class Meteostick(object):
                             soil_moisture = lookup_potential(
                                 "soil_moisture", norm_fact,
                                 potential_raw, temp_c, SM_MAP)
-                            data['soil_moisture_%s' % sensor_num] = soil_moisture
-                            dbg_parse(3, "soil_moisture_%s=%s 0x%03x" %
+                            data['soil_moisture_%s%s' % (sensor_num, tx.suffix)] = soil_moisture
+                            dbg_parse(3, "soil_moisture_%s=%s 0x%03x",
                                       (sensor_num, soil_moisture, potential_raw))
                     elif data_subtype == 2:
                         # leaf wetness
@@ -996,8 +3559,8 @@ class Meteostick(object):
                         if pkt[3] != 0xFF:
                             # leaf temperature
                             temp_c = calculate_thermistor_temp(temp_raw)
-                            data['leaf_temp_%s' % sensor_num] = temp_c
-                            dbg_parse(3, "leaf_temp_%s=%s 0x%03x" %
+                            data['leaf_temp_%s%s' % (sensor_num, tx.suffix)] = units.temp(temp_c)
+                            dbg_parse(3, "leaf_temp_%s=%s 0x%03x",
                                       (sensor_num, temp_c, temp_raw))
                         if pkt[2] != 0:
                             # leaf wetness potential
@@ -1006,21 +3569,180 @@ class Meteostick(object):
                             leaf_wetness = lookup_potential(
                                 "leaf_wetness", norm_fact,
                                 potential_raw, temp_c, LW_MAP)
-                            data['leaf_wetness_%s' % sensor_num] = leaf_wetness
-                            dbg_parse(3, "leaf_wetness_%s=%s 0x%03x" %
+                            data['leaf_wetness_%s%s' % (sensor_num, tx.suffix)] = leaf_wetness
+                            dbg_parse(3, "leaf_wetness_%s=%s 0x%03x",
                                       (sensor_num, leaf_wetness, potential_raw))
                     else:
                         logerr("unknown subtype '%s' in '%s'" % (data_subtype, raw))
-
-            else:
-                logerr("unknown station with channel: %s, raw message: %s" %
-                       (data['channel'], raw))
         elif parts[0] == '#':
             loginf("%s" % raw)
         else:
             logerr("unknown sensor identifier '%s' in %s" % (parts[0], raw))
         return data
 
+    @staticmethod
+    def get_batch(lines):
+        """Collect the raw Davis messages ('I' lines) of a capture into arrays
+        that can be passed to parse_raw_batch.  Other lines are skipped.
+        Returns a tuple of payloads (N x 10), rf_signal (N) and
+        time_since_last (N)."""
+        if numpy is None:
+            raise ImportError("batch decoding requires numpy")
+        payloads = []
+        rf_signal = []
+        time_since_last = []
+        for raw in lines:
+            parts = raw.strip().split(' ')
+            if parts[0] != 'I' or len(parts) < 15:
+                continue
+            try:
+                payloads.append([int(x, 16) for x in parts[2:12]])
+                rf_signal.append(int(parts[13]))
+                time_since_last.append(int(parts[14]))
+            except ValueError:
+                dbg_parse(1, "skip batch line '%s'", raw)
+        return (numpy.array(payloads, dtype=numpy.uint8).reshape(-1, 10),
+                numpy.array(rf_signal, dtype=numpy.int32),
+                numpy.array(time_since_last, dtype=numpy.int64))
+
+    @staticmethod
+    def parse_raw_batch(payloads, rf_signal, time_since_last,
+                        iss_ch, wind_ch, ls_ch, th1_ch, th2_ch, rain_per_tip):
+        """Decode many raw Davis messages at once.
+
+        This is the vectorised equivalent of parse_raw for the 10-byte raw
+        messages, intended for analysis and calibration of captured data.
+        Bit fields are extracted for all messages at once and conversions
+        are done with lookup tables built from the scalar formulas, so the
+        results are identical to those of parse_raw.
+
+        :param payloads: array (N x 10) with the raw message bytes
+        :param rf_signal: array (N) with the rf signal of each message
+        :param time_since_last: array (N) with the time since the last
+                                message of the channel in microseconds
+        :return: a numpy structured array with the fields in BATCH_FIELDS.
+                 Messages with a bad crc have crc_ok set to False and no
+                 observations.
+        """
+        if numpy is None:
+            raise ImportError("batch decoding requires numpy")
+        tab = _get_batch_tables()
+        pkt = numpy.asarray(payloads, dtype=numpy.uint8).reshape(-1, 10)
+        n = len(pkt)
+        p = [pkt[:, i].astype(numpy.int64) for i in range(10)]
+        out = numpy.zeros(n, dtype=BATCH_FIELDS)
+        for name, fmt in BATCH_FIELDS:
+            if fmt == 'f8':
+                out[name] = numpy.nan
+
+        # crc-check of messages from davis equipment and via repeater
+        from_davis = (p[8] == 0xFF) & (p[9] == 0xFF)
+        crc_davis = _batch_crc16(tab['crc'], pkt[:, 0:8].T.astype(numpy.uint16))
+        crc_repeater = _batch_crc16(
+            tab['crc'], numpy.vstack([pkt[:, 0:6].T, pkt[:, 8:10].T]).astype(numpy.uint16))
+        ok = numpy.where(from_davis, crc_davis == 0,
+                         crc_repeater == (p[6] << 8) + p[7])
+        out['crc_ok'] = ok
+
+        ch = (p[0] & 0x7) + 1
+        battery = (p[0] >> 3) & 0x1
+        message_type = p[0] >> 4
+        out['channel'] = numpy.where(ok, ch, 0)
+        out['battery'] = battery
+        out['message_type'] = message_type
+        out['rf_signal'] = numpy.asarray(rf_signal)
+        out['rf_missed'] = numpy.asarray(time_since_last) // 2500000 - 1
+
+        is_iss = ok & (ch == iss_ch)
+        is_wind = ok & ~is_iss & (ch == wind_ch)
+        is_th1 = ok & ~is_iss & ~is_wind & (ch == th1_ch)
+        is_th2 = ok & ~is_iss & ~is_wind & ~is_th1 & (ch == th2_ch)
+        tx = is_iss | is_wind | is_th1 | is_th2
+        is_ls = ok & ~tx & (ch == ls_ch)
+        for name, mask in [('bat_iss', is_iss), ('bat_anemometer', is_wind),
+                           ('bat_th_1', is_th1), ('bat_th_2', is_th2),
+                           ('bat_leaf_soil', is_ls)]:
+            out[name] = numpy.where(mask, battery, numpy.nan)
+
+        # wind, reported by every transmitter except the leaf/soil station
+        speed_raw = p[1]
+        dir_raw = p[2]
+        m = tx & ~((speed_raw == 0) & (dir_raw == 0))
+        speed_ec = tab['wind_ec'][speed_raw, dir_raw]
+        out['wind_speed_raw'][m] = speed_raw[m]
+        out['wind_speed_ec'][m] = speed_ec[m]
+        out['wind_dir'][m] = tab['wind_dir'][dir_raw[m]]
+        out['wind_speed'][m] = speed_ec[m] * MPH_TO_MPS
+
+        # 10-bit values of supercap, uv, solar radiation and solar power
+        raw10 = ((p[3] << 2) + (p[4] >> 6)) & 0x3FF
+        m = tx & (message_type == 2) & (raw10 != 0x3FF)
+        out['supercap_volt'][m] = raw10[m] / 300.0
+        m = tx & (message_type == 4) & (raw10 != 0x3FF)
+        out['uv'][m] = raw10[m] / 50.0
+        m = tx & (message_type == 6) & (raw10 < 0x3FE)
+        out['solar_radiation'][m] = raw10[m] * 1.757936
+        m = tx & (message_type == 7) & (raw10 != 0x3FF)
+        out['solar_power'][m] = raw10[m] / 300.0
+
+        # rain rate, only when received from the iss
+        tbt_raw = ((p[4] & 0x30) << 4) + p[3]
+        m = is_iss & (message_type == 5)
+        tbt = numpy.where(p[4] & 0x40 == 0, tbt_raw / 16.0, tbt_raw * 1.0)
+        with numpy.errstate(divide='ignore'):
+            rain_rate = numpy.where(tbt_raw == 0x3FF, 0.0,
+                                    3600.0 / tbt * rain_per_tip)
+        rain_rate[tbt_raw == 0] = numpy.nan
+        out['rain_rate'][m] = rain_rate[m]
+
+        # outside temperature
+        temp_raw = (p[3] << 4) + (p[4] >> 4)
+        m = tx & (message_type == 8) & (temp_raw != 0xFFC) & (temp_raw != 0xFF8)
+        temp_c = numpy.where(p[4] & 0x8, tab['temp_digital'][temp_raw],
+                             tab['thermistor'][temp_raw])
+        # assign to the sensor in the same order as parse_raw does
+        to_th1 = tx & (ch == th1_ch)
+        to_th2 = tx & ~to_th1 & (ch == th2_ch)
+        to_wind = tx & ~to_th1 & ~to_th2 & (ch == wind_ch)
+        to_iss = tx & ~to_th1 & ~to_th2 & ~to_wind
+        for name, mask in [('temp_1', to_th1), ('temp_2', to_th2),
+                           ('temp_3', to_wind), ('temperature', to_iss)]:
+            out[name][m & mask] = temp_c[m & mask]
+
+        # outside humidity; the humidity of the anemometer transmitter kit
+        # is not reported
+        humidity_raw = ((p[4] >> 4) << 8) + p[3]
+        m = tx & (message_type == 0xA) & (humidity_raw != 0)
+        humidity = tab['humidity'][(p[4] & 0x08 == 0x8).astype(numpy.int64), humidity_raw]
+        for name, mask in [('humid_1', to_th1), ('humid_2', to_th2),
+                           ('humidity', to_iss)]:
+            out[name][m & mask] = humidity[m & mask]
+
+        # rain counter
+        m = tx & (message_type == 0xE) & (p[3] != 0x80)
+        out['rain_count'][m] = p[3][m] & 0x7F
+
+        # leaf and soil station
+        ls = is_ls & (message_type == 0xF)
+        subtype = p[1] & 0x3
+        out['sensor_num'] = numpy.where(ls, ((p[1] & 0xe0) >> 5) + 1, 0)
+        ls_temp_raw = ((p[3] << 2) + (p[5] >> 6)) & 0x3FF
+        potential_raw = ((p[2] << 2) + (p[4] >> 6)) & 0x3FF
+        has_temp = p[3] != 0xFF
+        ls_temp = numpy.where(has_temp, tab['thermistor'][ls_temp_raw * 4],
+                              DEFAULT_SOIL_TEMP)
+        m = ls & (subtype == 1)
+        out['soil_temp'][m & has_temp] = ls_temp[m & has_temp]
+        m &= p[2] != 0xFF
+        out['soil_moisture'][m] = _batch_lookup_potential(
+            0.009, potential_raw[m], ls_temp[m], tab['sm_raw'], tab['sm_pot'])
+        m = ls & (subtype == 2)
+        out['leaf_temp'][m & has_temp] = ls_temp[m & has_temp]
+        m &= p[2] != 0
+        out['leaf_wetness'][m] = _batch_lookup_potential(
+            0.0, potential_raw[m], ls_temp[m], tab['lw_raw'], tab['lw_pot'])
+        return out
+
     # Normalize and interpolate raw wind values at raw angles
     @staticmethod
     def calc_wind_speed_ec(raw_mph, raw_angle):
@@ -1153,7 +3875,7 @@ class Meteostick(object):
                     y0, y1,
                     x, y):
 
-        dbg_parse(3, "rx0=%s, rx1=%s, ry0=%s, ry1=%s, x0=%s, x1=%s, y0=%s, y1=%s, x=%s, y=%s" %
+        dbg_parse(3, "rx0=%s, rx1=%s, ry0=%s, ry1=%s, x0=%s, x1=%s, y0=%s, y1=%s, x=%s, y=%s",
                   (rx0, rx1, ry0, ry1, x0, x1, y0, y1, x, y))
 
         if rx0 == rx1:
@@ -1176,7 +3898,12 @@ class MeteostickConfEditor(weewx.drivers.AbstractConfEditor):
     # This section is for the Meteostick USB receiver.
 
     # The serial port to which the meteostick is attached, e.g., /dev/ttyS0
+    # With auto the ports that match port_patterns are probed at startup and
+    # the port that answers like a meteostick is cached in port_cache.
     port = /dev/ttyUSB0
+    # port_patterns = /dev/serial/by-id/*, /dev/ttyUSB*, /dev/ttyACM*
+    # port_cache = /var/tmp/meteostick-port
+    # probe_timeout = 3
 
     # Radio frequency to use between USB transceiver and console: US, EU or AU
     # US uses 915 MHz
@@ -1196,6 +3923,121 @@ class MeteostickConfEditor(weewx.drivers.AbstractConfEditor):
     # Rain bucket type: 0 is 0.01 inch per tip, 1 is 0.2 mm per tip
     rain_bucket_type = 1
 
+    # Measure the latency of each stage of the read loop.  The timing is
+    # logged with each archive record, or on timing_signal (e.g. USR1).  A
+    # cProfile of profile_seconds is logged on profile_signal (e.g. USR2).
+    stage_timing = False
+    # timing_signal = USR1
+    # profile_signal = USR2
+    # profile_seconds = 60
+
+    # Serve the driver metrics in Prometheus format over http on a local port
+    # or a unix socket, e.g. curl http://localhost:9101/metrics
+    # metrics_port = 9101
+    # metrics_address = 127.0.0.1
+    # metrics_socket = /var/run/meteostick-metrics.sock
+
+    # Keep the last ring_records loop packets in a memory-mapped ring file
+    # that other local processes can read (see LoopRingReader).
+    # ring_file = /var/tmp/meteostick-loop.ring
+    # ring_records = 20000
+    # ring_fields = windSpeed, windDir, outTemp, outHumidity, rain
+
+    # Share the data of the meteostick with other processes: the raw lines
+    # and loop packets are published on a local tcp port or unix socket.
+    # broker_port = 9102
+    # broker_address = 127.0.0.1
+    # broker_socket = /var/run/meteostick-broker.sock
+    # broker_queue = 1000
+    # Read from the broker of another process instead of the serial port,
+    # either host:port or the path of a unix socket.
+    # broker = localhost:9102
+
+    # The unit system of the loop packets: US, METRIC or METRICWX.  When it
+    # is the target_unit of [StdConvert] the packets need no conversion.
+    # The deadband values are in the units of this unit system.
+    # unit_system = METRICWX
+
+    # Decode all messages, also those with fields that are not in the
+    # sensor_map
+    # decode_all = False
+
+    # Calculate the rain rate from the rain rate of the transmitter and the
+    # timing of the tips, and the rain totals of the last 15 and 60 minutes
+    # (rain_15 and rain_60, e.g. map hourRain = rain_60 in the sensor_map)
+    # rain_statistics = True
+
+    # Calculate the gust over 10 minutes and the 2- and 10-minute wind
+    # averages of the wind channel.  They are only reported when they are
+    # added to the sensor_map, e.g. windGust10 = wind_gust_10, windGustDir10 =
+    # wind_gust_dir_10, windSpeed2 = wind_speed_2, windDir2 = wind_dir_2,
+    # windSpeed10 = wind_speed_10 and windDir10 = wind_dir_10.  windGust =
+    # wind_gust is the gust of each sample, not of the last 10 minutes.
+    # wind_statistics = True
+
+    # Store the rf statistics of each channel for each archive interval in
+    # the rf_stats table of a sqlite database, rf_stats_batch intervals per
+    # transaction.
+    # rf_stats_database = /var/lib/weewx/meteostick-rf.sdb
+    # rf_stats_batch = 6
+
+    # Adjust the rf_sensitivity to the reception every rf_tune_interval
+    # seconds: raise it when frames of weak transmitters are missed, lower
+    # it when more than rf_tune_max_crc_rate of the frames are noise with
+    # crc errors.  It stays between rf_sensitivity_min and rf_sensitivity_max.
+    # rf_auto_tune = False
+    # rf_sensitivity_min = 70
+    # rf_sensitivity_max = 110
+    # rf_tune_interval = 600
+    # rf_tune_max_crc_rate = 0.05
+
+    # Additional temp_hum or leaf_soil transmitters, by channel.  Their
+    # fields get the channel as suffix, e.g. temp_ch3, humid_ch3, bat_ch3 or
+    # soil_moisture_1_ch5, and can be added to the sensor_map.
+    # [[extra_transmitters]]
+    #     3 = temp_hum
+    #     5 = leaf_soil
+
+    # Change rf_sensitivity, transceiver_frequency, repeater or the channels
+    # while running by sending '<setting> <value>' lines to a local tcp port
+    # or unix socket.
+    # control_port = 9103
+    # control_address = 127.0.0.1
+    # control_socket = /var/run/meteostick-control.sock
+
+    # Wait for serial data only until the next message of a transmitter is
+    # due, so that missed messages are detected right away.
+    adaptive_timeout = False
+
+    # Merge the data of consecutive frames into one loop packet.  A packet
+    # is emitted after coalesce_max_latency seconds (0 disables merging), or
+    # as soon as it has coalesce_min_fields observations (0 is no minimum).
+    # One transmit cycle of an ISS on channel 1 is 2.5625 seconds.
+    coalesce_max_latency = 0
+    coalesce_min_fields = 0
+
+    # Generate archive records in the driver with this interval in seconds.
+    # Use it with record_generation = hardware in section [StdArchive].
+    # archive_interval = 300
+
+    # Emit slow-moving fields only when they change by more than a deadband,
+    # or when they were not emitted for the refresh interval (in seconds,
+    # default 60).  The refresh interval should be less than the archive
+    # interval.
+    # [[deadband]]
+    #     soilTemp1 = 0.1
+    #     supplyVoltage = 0.01
+    # [[refresh_interval]]
+    #     soilTemp1 = 120
+
+    # Keep the latest value of each field, served as json on /current of the
+    # metrics endpoint.  A field that was not received within its maximum
+    # age (in seconds, default 900) is dropped.  With merge_current_conditions
+    # each loop packet carries all fields that are not stale.
+    # merge_current_conditions = False
+    # [[max_age]]
+    #     soilMoist1 = 300
+
     # Print debug messages
     #  0=no logging; 1=minimum logging; 2=normal logging; 3=detailed logging
     debug_parse = 0
@@ -1270,28 +4112,27 @@ class MeteostickConfigurator(weewx.drivers.AbstractConfigurator):
             help="set format: 0=raw, 1=machine, 2=human")
 
     def do_options(self, options, parser, config_dict, prompt):
-        driver = MeteostickDriver(None, config_dict)
-        info = driver.station.reset()
-        if options.info:
-            print(info)
-        cfg = {
-            'v': options.verbose,
-            'd': options.debug,
-            'l': options.led,
-            'b': options.bandwidth,
-            'p': options.probe,
-            'r': options.repeater,
-            'c': options.channel,
-            'o': options.format}
-        for opt in cfg:
-            if cfg[opt]:
-                cmd = opt + cfg[opt]
-                print("set station parameter %s" % cmd)
-                driver.station.send_command(cmd)
-        if options.opts:
-            driver.station.send_command('?')
-            print(driver.station.get())
-        driver.closePort()
+        # only the serial session is needed to send commands
+        with Meteostick(**config_dict.get(DRIVER_NAME, {})) as station:
+            info = station.reset()
+            if options.info:
+                print(info)
+            cfg = {
+                'v': options.verbose,
+                'd': options.debug,
+                'l': options.led,
+                'b': options.bandwidth,
+                'p': options.probe,
+                'r': options.repeater,
+                'c': options.channel,
+                'o': options.format}
+            for opt in cfg:
+                if cfg[opt] is not None:
+                    cmd = opt + str(cfg[opt])
+                    print("set station parameter %s" % cmd)
+                    station.send_command(cmd)
+            if options.opts:
+                print(station.send_command('?'))
 
 
 # define a main entry point for basic testing of the station without weewx
@@ -1333,12 +4174,38 @@ if __name__ == '__main__':
                       help='channel for T/H sensor 1', default=0)
     parser.add_option('--th2-channel', dest='c_th2', metavar='TH2_CHANNEL',
                       help='channel for T/H sensor 2', default=0)
+    parser.add_option('--batch', dest='batch', metavar='FILE',
+                      help='decode the raw lines of FILE with the batch '
+                      'decoder and print them as csv')
+    parser.add_option('--discover', dest='discover', action='store_true',
+                      help='probe the serial ports for a meteostick')
+    parser.add_option('--patterns', dest='patterns', metavar='PATTERNS',
+                      help='with --discover, comma-separated port patterns')
     (opts, args) = parser.parse_args()
 
     if opts.version:
         print("meteostick driver version %s" % DRIVER_VERSION)
         exit(0)
 
+    if opts.batch:
+        with open(opts.batch) as f:
+            payloads, rf_signal, time_since_last = Meteostick.get_batch(f)
+        out = Meteostick.parse_raw_batch(
+            payloads, rf_signal, time_since_last, int(opts.c_iss),
+            int(opts.c_a), int(opts.c_ls), int(opts.c_th1), int(opts.c_th2),
+            METRICWX_UNITS.rain_per_tip(1))
+        names = [name for name, _ in BATCH_FIELDS]
+        print(','.join(names))
+        for row in out:
+            print(','.join('' if v != v else str(v) for v in row.tolist()))
+        exit(0)
+
+    if opts.discover:
+        patterns = opts.patterns.split(',') if opts.patterns else None
+        port = discover_port(patterns, int(opts.baud))
+        print(port or "no meteostick found")
+        exit(0 if port else 1)
+
     with Meteostick(port=opts.port, baudrate=opts.baud,
                     transceiver_frequency=opts.freq,
                     iss_channel=int(opts.c_iss),
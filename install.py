@@ -10,7 +10,7 @@ def loader():
 class MeteostickInstaller(ExtensionInstaller):
     def __init__(self):
         super(MeteostickInstaller, self).__init__(
-            version="0.61",
+            version="0.62",
             name='meteostick',
             description='Collect data from meteostick via serial port',
             author="Matthew Wall",
@@ -0,0 +1,34 @@
+# fixtures for the meteostick driver tests
+# Distributed under the terms of the GNU Public License (GPLv3)
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'bin'))
+
+import user.meteostick as meteostick
+
+from tests.replay import ReplayPort, synthetic_lines
+
+# seconds between the frames of the iss
+INTERVAL = 41 / 16.0
+
+
+@pytest.fixture
+def clock():
+    return meteostick.VirtualClock()
+
+
+@pytest.fixture
+def replay_port(clock):
+    """Returns a function that makes a ReplayPort of count synthetic frames,
+    or of the given lines, on the virtual clock."""
+    def make(count=2000, lines=None):
+        import itertools
+        if lines is None:
+            lines = synthetic_lines()
+        return ReplayPort(itertools.islice(lines, count), clock, INTERVAL)
+    return make
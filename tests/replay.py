@@ -0,0 +1,110 @@
+# replayed and synthetic raw lines for the meteostick driver tests
+# Distributed under the terms of the GNU Public License (GPLv3)
+
+import random
+
+from user.meteostick import CRC16_TABLE, SYSTEM_CLOCK, _monotonic
+
+
+class EndOfReplay(Exception):
+    """All lines of a ReplayPort were read."""
+
+
+class ReplayPort(object):
+    """Replay raw lines in place of a serial port.
+
+    Each line arrives interval seconds after the previous one on the clock,
+    so with a VirtualClock a capture or a synthetic stream runs as fast as
+    it can be processed.  Commands are answered with the '?' prompt of the
+    meteostick.  EndOfReplay is raised after the last line.
+    """
+
+    def __init__(self, lines, clock=SYSTEM_CLOCK, interval=0.0):
+        self.lines = iter(lines)
+        self.clock = clock
+        self.interval = interval
+        self.timeout = None
+        self.response = b''
+        self.count = 0
+        self.read_ts = None # system time the last line was read
+
+    def readline(self):
+        try:
+            line = next(self.lines)
+        except StopIteration:
+            raise EndOfReplay("end of replay after %s lines" % self.count)
+        self.clock.sleep(self.interval)
+        self.count += 1
+        self.read_ts = _monotonic()
+        return line.rstrip('\r\n').encode('utf-8') + b'\r\n'
+
+    def inWaiting(self):
+        return len(self.response)
+
+    def read(self, size=1):
+        data = self.response[:size]
+        self.response = self.response[size:]
+        return data
+
+    def write(self, data):
+        self.response = b'?'
+
+    def flushInput(self):
+        self.response = b''
+
+    def close(self):
+        pass
+
+
+def davis_line(pkt, rf_signal, time_since_last, crc_error=False):
+    """The raw line of the 6 message bytes of a davis transmitter."""
+    crc = 0
+    for b in pkt:
+        crc = (CRC16_TABLE[(crc >> 8) ^ b] ^ (crc << 8)) & 0xFFFF
+    pkt = list(pkt) + [crc >> 8, crc & 0xFF, 0xFF, 0xFF]
+    if crc_error:
+        pkt[5] ^= 0x01
+    return 'I 100 %s  %d %d 0' % (' '.join('%X' % b for b in pkt),
+                                  rf_signal, time_since_last)
+
+
+def synthetic_lines(count=None, seed=0, storm_every=200000, storm_length=1000):
+    """Raw lines of an iss on channel 1 with plausible, slowly changing
+    values.  The rain counter wraps around every 128 tips, a B line follows
+    every 20 messages, and every storm_every lines a storm of storm_length
+    lines with crc errors is sent."""
+    rnd = random.Random(seed)
+    types = [8, 0xE, 5, 0xE, 4, 0xE, 6, 0xE, 9, 0xE, 0xA, 0xE]
+    temp_f10, humidity10, rain_count = 600, 500, 0
+    n = 0
+    while count is None or n < count:
+        message_type = types[n % len(types)]
+        pkt = [message_type << 4, rnd.randint(0, 30), rnd.randint(1, 255),
+               0, 0, 0]
+        if message_type == 8:
+            temp_f10 = max(-400, min(1200, temp_f10 + rnd.randint(-2, 2)))
+            raw = temp_f10 & 0xFFF
+            pkt[3], pkt[4] = raw >> 4, ((raw & 0xF) << 4) | 0x8
+        elif message_type == 0xA:
+            humidity10 = max(10, min(1000, humidity10 + rnd.randint(-5, 5)))
+            pkt[3], pkt[4] = humidity10 & 0xFF, ((humidity10 >> 8) << 4) | 0x8
+        elif message_type == 0xE:
+            if rnd.random() < 0.1:
+                rain_count = (rain_count + 1) & 0x7F
+            pkt[3] = rain_count
+        elif message_type == 5:
+            pkt[3], pkt[4] = 0xFF, 0x30 # no rain
+        elif message_type in (4, 6):
+            raw = rnd.randint(0, 0x3FD)
+            pkt[3], pkt[4] = raw >> 2, (raw & 0x3) << 6
+        elif message_type == 9:
+            pkt[3], pkt[5] = rnd.randint(0, 40), 0x10
+        crc_error = storm_every and \
+            n % storm_every >= storm_every - storm_length
+        yield davis_line(pkt, -rnd.randint(50, 90),
+                         2562500 if rnd.random() > 0.01 else 5125000,
+                         crc_error)
+        n += 1
+        if n % 20 == 0:
+            yield 'B 29530 338141 %d %d 60 37' % (
+                rnd.randint(180, 260), rnd.randint(98000, 104000))
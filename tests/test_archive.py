@@ -0,0 +1,117 @@
+# tests of the archive accumulator of the meteostick driver
+# Distributed under the terms of the GNU Public License (GPLv3)
+
+import math
+
+import pytest
+
+import weewx
+
+from user.meteostick import ArchiveAccumulator
+
+
+def packet(ts, **fields):
+    fields.update({'dateTime': ts, 'usUnits': weewx.METRICWX})
+    return fields
+
+
+def test_boundary_alignment():
+    a = ArchiveAccumulator(300)
+    assert a.add(packet(1000, outTemp=20.0)) is None
+    assert a.end_ts == 1200
+    # a packet stamped on the boundary belongs to the interval it ends
+    assert a.add(packet(1200, outTemp=22.0)) is None
+    record = a.add(packet(1201, outTemp=30.0))
+    assert record['dateTime'] == 1200
+    assert record['interval'] == 5
+    assert record['usUnits'] == weewx.METRICWX
+    assert record['outTemp'] == 21.0
+    assert a.end_ts == 1500
+
+
+def test_first_packet_on_a_boundary():
+    a = ArchiveAccumulator(300)
+    a.add(packet(1200, outTemp=20.0))
+    assert a.end_ts == 1200
+    assert a.add(packet(1201, outTemp=21.0))['dateTime'] == 1200
+
+
+def test_gap_does_not_emit_empty_records():
+    a = ArchiveAccumulator(60)
+    a.add(packet(10, outTemp=20.0))
+    record = a.add(packet(500, outTemp=21.0))
+    assert record['dateTime'] == 60
+    assert a.end_ts == 540
+    assert [r['dateTime'] for r in a.get_records(None)] == [60]
+
+
+def test_close():
+    a = ArchiveAccumulator(300)
+    assert a.close(1000) is None
+    a.add(packet(1000, outTemp=20.0))
+    assert a.close(1200) is None
+    record = a.close(1200.5)
+    assert record['dateTime'] == 1200
+    assert a.end_ts is None
+    assert a.close(1800) is None
+
+
+def test_rain_is_summed():
+    a = ArchiveAccumulator(300)
+    a.add(packet(1000, rain=0.2))
+    a.add(packet(1010, rain=None))
+    a.add(packet(1020, rain=0.4))
+    assert a.close(1500)['rain'] == pytest.approx(0.6)
+
+
+def test_no_rain():
+    a = ArchiveAccumulator(300)
+    a.add(packet(1000, outTemp=20.0))
+    assert a.close(1500)['rain'] is None
+
+
+def test_directions_are_vector_averages():
+    a = ArchiveAccumulator(300)
+    a.add(packet(1000, windGustDir=350.0))
+    a.add(packet(1010, windGustDir=10.0))
+    record = a.close(1500)
+    # an arithmetic mean would be 180
+    assert math.cos(math.radians(record['windGustDir'])) == pytest.approx(1.0)
+
+
+def test_wind():
+    a = ArchiveAccumulator(300)
+    a.add(packet(1000, windSpeed=1.0, windDir=90.0))
+    a.add(packet(1010, windSpeed=3.0, windDir=180.0))
+    a.add(packet(1020, windSpeed=0.0, windDir=270.0))
+    record = a.close(1500)
+    assert record['windSpeed'] == pytest.approx(4.0 / 3)
+    # the direction is weighted with the speed
+    assert record['windDir'] == pytest.approx(161.565, abs=1e-3)
+    assert record['windGust'] == 3.0
+    assert record['windGustDir'] == 180.0
+
+
+def test_calm():
+    a = ArchiveAccumulator(300)
+    a.add(packet(1000, windSpeed=0.0, windDir=90.0))
+    record = a.close(1500)
+    assert record['windDir'] is None
+    assert record['windGust'] == 0.0
+
+
+def test_battery_status_is_the_last():
+    a = ArchiveAccumulator(300)
+    a.add(packet(1000, txBatteryStatus=0))
+    a.add(packet(1010, txBatteryStatus=1))
+    assert a.close(1500)['txBatteryStatus'] == 1
+
+
+def test_records_are_kept():
+    a = ArchiveAccumulator(60)
+    for ts in range(30, 30 + 60 * (ArchiveAccumulator.MAX_RECORDS + 5), 60):
+        a.add(packet(ts, outTemp=20.0))
+    records = list(a.get_records(None))
+    assert len(records) == ArchiveAccumulator.MAX_RECORDS
+    last = records[-1]['dateTime']
+    assert [r['dateTime'] for r in a.get_records(last - 60)] == [last]
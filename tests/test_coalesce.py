@@ -0,0 +1,60 @@
+# tests of the packet coalescer of the meteostick driver
+# Distributed under the terms of the GNU Public License (GPLv3)
+
+from user.meteostick import PacketCoalescer
+
+
+def packet(ts, **fields):
+    fields.update({'dateTime': ts, 'usUnits': 17})
+    return fields
+
+
+def test_latest_value_wins():
+    c = PacketCoalescer(max_latency=10)
+    assert c.add(packet(100, outTemp=20.0, windSpeed=1.0), 100) is None
+    assert c.add(packet(102, outTemp=20.5), 102) is None
+    merged = c.add(packet(110, outHumidity=50.0), 110)
+    assert merged == packet(110, outTemp=20.5, windSpeed=1.0,
+                            outHumidity=50.0)
+    assert c.pending is None
+
+
+def test_rain_is_summed():
+    c = PacketCoalescer(max_latency=10)
+    c.add(packet(100, rain=0.2), 100)
+    c.add(packet(102, rain=None), 102)
+    c.add(packet(104, rain=0.2), 104)
+    assert c.add(packet(110, rain=0.4), 110)['rain'] == 0.8
+
+
+def test_missing_rain_is_replaced():
+    c = PacketCoalescer(max_latency=10)
+    c.add(packet(100, rain=None), 100)
+    assert c.add(packet(110, rain=0.2), 110)['rain'] == 0.2
+
+
+def test_min_fields():
+    c = PacketCoalescer(max_latency=60, min_fields=3)
+    assert c.add(packet(100, outTemp=20.0), 100) is None
+    assert c.add(packet(101, outTemp=20.1, outHumidity=50.0), 101) is None
+    merged = c.add(packet(102, windSpeed=1.0), 102)
+    assert merged == packet(102, outTemp=20.1, outHumidity=50.0,
+                            windSpeed=1.0)
+
+
+def test_expire():
+    c = PacketCoalescer(max_latency=10)
+    assert c.expire(100) is None
+    c.add(packet(100, outTemp=20.0), 100)
+    assert c.expire(109.9) is None
+    assert c.expire(110) == packet(100, outTemp=20.0)
+    assert c.expire(120) is None
+
+
+def test_window_starts_with_next_packet():
+    c = PacketCoalescer(max_latency=10)
+    c.add(packet(100, outTemp=20.0), 100)
+    c.expire(110)
+    assert c.add(packet(115, outTemp=21.0), 115) is None
+    assert c.add(packet(125, windSpeed=2.0), 125) == \
+        packet(125, outTemp=21.0, windSpeed=2.0)
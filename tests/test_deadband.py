@@ -0,0 +1,93 @@
+# tests of the deadband of the meteostick driver
+# Distributed under the terms of the GNU Public License (GPLv3)
+
+from user.meteostick import Deadband
+
+
+def test_small_changes_are_suppressed():
+    d = Deadband({'outTemp': 0.2}, {'outTemp': 60})
+    p = {'dateTime': 100, 'outTemp': 20.0}
+    d.apply(p, 100)
+    assert p['outTemp'] == 20.0
+    p = {'dateTime': 102, 'outTemp': 20.2}
+    d.apply(p, 102)
+    assert 'outTemp' not in p
+    assert d.suppressed == {'outTemp': 1}
+    assert d.suppressed_count == 1
+
+
+def test_changes_beyond_the_deadband_are_emitted():
+    d = Deadband({'outTemp': 0.2}, {})
+    d.apply({'outTemp': 20.0}, 100)
+    p = {'outTemp': 20.3}
+    d.apply(p, 102)
+    assert p == {'outTemp': 20.3}
+    # the deadband is relative to the last emitted value
+    p = {'outTemp': 20.05}
+    d.apply(p, 104)
+    assert p == {'outTemp': 20.05}
+
+
+def test_no_drift_through_the_deadband():
+    d = Deadband({'outTemp': 0.2}, {})
+    d.apply({'outTemp': 20.0}, 100)
+    for i, value in enumerate([20.1, 20.2]):
+        p = {'outTemp': value}
+        d.apply(p, 101 + i)
+        assert p == {}
+    p = {'outTemp': 20.3}
+    d.apply(p, 103)
+    assert p == {'outTemp': 20.3}
+
+
+def test_refresh_interval():
+    d = Deadband({'outTemp': 0.5}, {'outTemp': 30})
+    d.apply({'outTemp': 20.0}, 100)
+    p = {'outTemp': 20.0}
+    d.apply(p, 129)
+    assert p == {}
+    p = {'outTemp': 20.0}
+    d.apply(p, 130)
+    assert p == {'outTemp': 20.0}
+    p = {'outTemp': 20.0}
+    d.apply(p, 131)
+    assert p == {}
+
+
+def test_refresh_interval_only():
+    # a field with only a refresh interval has a deadband of 0
+    d = Deadband({}, {'outHumidity': 30})
+    assert d.deadband == {'outHumidity': 0.0}
+    d.apply({'outHumidity': 50.0}, 100)
+    p = {'outHumidity': 50.0}
+    d.apply(p, 110)
+    assert p == {}
+    p = {'outHumidity': 51.0}
+    d.apply(p, 111)
+    assert p == {'outHumidity': 51.0}
+
+
+def test_default_refresh_interval():
+    d = Deadband({'outTemp': 0.5}, {})
+    assert d.refresh_interval == {
+        'outTemp': Deadband.DEFAULT_REFRESH_INTERVAL}
+
+
+def test_none_is_emitted():
+    d = Deadband({'outTemp': 0.5}, {})
+    d.apply({'outTemp': 20.0}, 100)
+    p = {'outTemp': None}
+    d.apply(p, 101)
+    assert p == {'outTemp': None}
+    p = {'outTemp': 20.0}
+    d.apply(p, 102)
+    assert p == {'outTemp': 20.0}
+
+
+def test_excluded_fields():
+    d = Deadband({'dateTime': 1, 'usUnits': 1, 'rain': 1, 'outTemp': 1}, {})
+    assert sorted(d.deadband) == ['outTemp']
+    d.apply({'dateTime': 100, 'usUnits': 17, 'rain': 0.0}, 100)
+    p = {'dateTime': 101, 'usUnits': 17, 'rain': 0.0}
+    d.apply(p, 101)
+    assert p == {'dateTime': 101, 'usUnits': 17, 'rain': 0.0}
@@ -0,0 +1,87 @@
+# tests of the port discovery of the meteostick driver
+# Distributed under the terms of the GNU Public License (GPLv3)
+
+import os
+import threading
+
+import pytest
+
+import serial
+
+from user.meteostick import discover_port
+
+if not hasattr(os, 'openpty'):
+    pytest.skip("no ptys", allow_module_level=True)
+
+NUM_PORTS = 4
+LOCKED = 0 # the locked pty is probed first if not skipped
+DEVICE = 1
+TIMEOUT = 1.0
+
+
+@pytest.fixture
+def ptys(tmp_path):
+    """NUM_PORTS ptys linked as tty0.. in tmp_path.  One emulates the
+    meteostick, one emulates a meteostick but is locked as if another
+    process used it, and the others stay silent.  Yields the links and the
+    bytes received by each pty."""
+    import tty
+    ptys = [os.openpty() for _ in range(NUM_PORTS)]
+    links = []
+    for i, (_, slave) in enumerate(ptys):
+        tty.setraw(slave)
+        links.append(str(tmp_path / ('tty%d' % i)))
+        os.symlink(os.ttyname(slave), links[-1])
+    received = [b''] * NUM_PORTS
+
+    def emulate(i, master, answer):
+        while True:
+            try:
+                data = os.read(master, 256)
+            except OSError:
+                return
+            if not data:
+                return
+            received[i] += data
+            if answer and b'r' in data:
+                os.write(master, b'Meteostick Version 3.3\r\n?')
+
+    for i, (master, _) in enumerate(ptys):
+        t = threading.Thread(target=emulate,
+                             args=(i, master, i in (LOCKED, DEVICE)))
+        t.daemon = True
+        t.start()
+    holder = serial.Serial(links[LOCKED], exclusive=True)
+    try:
+        yield links, received
+    finally:
+        holder.close()
+        for master, slave in ptys:
+            os.close(slave)
+            os.close(master)
+
+
+def test_discovery(tmp_path, ptys):
+    links, received = ptys
+    cache = str(tmp_path / 'port')
+    patterns = [str(tmp_path / 'tty*')]
+    assert discover_port(patterns, timeout=TIMEOUT, cache=cache) == \
+        links[DEVICE]
+    assert not received[LOCKED], "nothing is sent to the locked port"
+    assert all(received[i] for i in range(NUM_PORTS)
+               if i not in (LOCKED, DEVICE)), "the silent ports are probed"
+    with open(cache) as f:
+        assert f.read().strip() == links[DEVICE]
+
+    probed = list(received)
+    assert discover_port(patterns, timeout=TIMEOUT, cache=cache) == \
+        links[DEVICE]
+    assert received[:DEVICE] + received[DEVICE + 1:] == \
+        probed[:DEVICE] + probed[DEVICE + 1:], \
+        "only the cached port is probed again"
+
+
+def test_no_meteostick(tmp_path, ptys):
+    links, _ = ptys
+    assert discover_port([links[-1]], timeout=TIMEOUT,
+                         cache=str(tmp_path / 'port')) is None
@@ -0,0 +1,71 @@
+# tests of the metrics server of the meteostick driver
+# Distributed under the terms of the GNU Public License (GPLv3)
+
+import json
+import socket
+
+import pytest
+
+from user.meteostick import DRIVER_NAME, MeteostickDriver
+
+from tests.replay import EndOfReplay
+
+
+def http_get(address, path):
+    # GET path from an http server on (host, port) or on a unix socket
+    if isinstance(address, tuple):
+        sock = socket.create_connection(address[:2], timeout=5)
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(5)
+        sock.connect(address)
+    try:
+        sock.sendall(('GET %s HTTP/1.0\r\n\r\n' % path).encode('utf-8'))
+        response = b''
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            response += data
+    finally:
+        sock.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split(b' ')[1]), body.decode('utf-8')
+
+
+@pytest.fixture(params=['tcp', 'unix'])
+def driver(request, tmp_path, clock, replay_port):
+    """A driver that replayed synthetic frames and serves its metrics on an
+    ephemeral tcp port or on a unix socket."""
+    if request.param == 'tcp':
+        server_cfg = {'metrics_port': 0}
+    else:
+        if not hasattr(socket, 'AF_UNIX'):
+            pytest.skip("no unix sockets")
+        server_cfg = {'metrics_socket': str(tmp_path / 'metrics.sock')}
+    driver = MeteostickDriver(None, {DRIVER_NAME: server_cfg}, clock=clock,
+                              connection=replay_port(2000))
+    try:
+        for _ in driver.genLoopPackets():
+            pass
+    except EndOfReplay:
+        pass
+    yield driver
+    driver.closePort()
+
+
+def test_metrics(driver):
+    status, metrics = http_get(driver.metrics_server.address, '/metrics')
+    assert status == 200
+    assert 'meteostick_frames_total{channel="1"' in metrics
+    assert 'meteostick_decode_errors_total{category="crc"}' in metrics
+
+
+def test_current(driver):
+    status, current = http_get(driver.metrics_server.address, '/current')
+    assert status == 200
+    assert json.loads(current)['outTemp']['channel'] == 1
+
+
+def test_unknown_path(driver):
+    assert http_get(driver.metrics_server.address, '/nothing')[0] == 404
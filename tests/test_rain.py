@@ -0,0 +1,94 @@
+# tests of the rain statistics of the meteostick driver
+# Distributed under the terms of the GNU Public License (GPLv3)
+
+import pytest
+
+from user.meteostick import RainStatistics
+
+
+@pytest.fixture
+def rain():
+    return RainStatistics(0.2)
+
+
+def test_first_count_has_no_tips(rain):
+    assert rain.add_count(0, 57) == 0
+    assert rain.add_count(10, 57) == 0
+    assert rain.add_count(20, 59) == 2
+
+
+def test_counter_wrap(rain):
+    rain.add_count(0, 126)
+    assert rain.add_count(10, 1) == 3
+    assert rain.add_count(20, 0) == 127
+    assert rain.add_count(30, 0) == 0
+
+
+def test_totals(rain):
+    rain.add_count(0, 0)
+    rain.add_count(100, 2)
+    rain.add_count(1000, 3)
+    values = rain.values(1000)
+    assert values['rain_15'] == pytest.approx(0.6)
+    assert values['rain_60'] == pytest.approx(0.6)
+    # the tips at 100 leave the 15-minute window
+    values = rain.values(1001)
+    assert values['rain_15'] == pytest.approx(0.2)
+    assert values['rain_60'] == pytest.approx(0.6)
+    values = rain.values(4601)
+    assert values['rain_15'] == 0
+    assert values['rain_60'] == 0
+
+
+def test_no_rain(rain):
+    assert rain.rate(0) == 0.0
+    rain.add_count(0, 5)
+    assert rain.values(10) == {'rain_rate': 0.0, 'rain_15': 0, 'rain_60': 0}
+
+
+def test_single_tip_rate(rain):
+    rain.add_count(0, 0)
+    rain.add_count(10, 1)
+    # one tip over the 15-minute window
+    assert rain.rate(20) == pytest.approx(0.2 * 3600 / 900)
+
+
+def test_rate_from_tips(rain):
+    rain.add_count(0, 0)
+    rain.add_count(10, 1)
+    rain.add_count(70, 2)
+    assert rain.rate(70) == pytest.approx(0.2 * 3600 / 60)
+    assert rain.rate(100) == pytest.approx(0.2 * 3600 / 60)
+    # the rate decays with the time since the last tip
+    assert rain.rate(190) == pytest.approx(0.2 * 3600 / 120)
+    assert rain.rate(70 + RainStatistics.MAX_TIP_AGE) == \
+        pytest.approx(0.2 * 3600 / RainStatistics.MAX_TIP_AGE)
+    assert rain.rate(71 + RainStatistics.MAX_TIP_AGE) == 0.0
+
+
+def test_transmitter_rate(rain):
+    rain.add_count(0, 0)
+    rain.add_count(10, 1)
+    rain.add_count(70, 2)
+    rain.add_rate(75, 15.0)
+    assert rain.rate(80) == 15.0
+    # a stale rate of the transmitter falls back to the tips
+    now = 75 + RainStatistics.MAX_RATE_AGE + 1
+    assert rain.rate(now) == pytest.approx(0.2 * 3600 / (now - 70))
+
+
+def test_transmitter_no_rain_after_a_tip(rain):
+    # the transmitter reports no rain for a while after a tip, so the
+    # rate from the tips is used
+    rain.add_count(0, 0)
+    rain.add_count(10, 1)
+    rain.add_count(70, 2)
+    rain.add_rate(75, 0.0)
+    assert rain.rate(80) == pytest.approx(0.2 * 3600 / 60)
+
+
+def test_transmitter_no_rain(rain):
+    rain.add_count(0, 0)
+    rain.add_count(10, 1)
+    rain.add_rate(100, 0.0)
+    assert rain.rate(110) == 0.0
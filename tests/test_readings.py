@@ -0,0 +1,73 @@
+# tests of the line reading of the meteostick driver
+# Distributed under the terms of the GNU Public License (GPLv3)
+
+import pytest
+
+from user.meteostick import Meteostick
+
+
+class StubPort(object):
+    """A serial port that returns the given reads; an empty read is a
+    timeout."""
+
+    def __init__(self, reads):
+        self.reads = list(reads)
+        self.timeout = 3
+
+    def readline(self):
+        return self.reads.pop(0) if self.reads else b''
+
+    def inWaiting(self):
+        return 0
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def station(clock):
+    def make(reads):
+        station = Meteostick(clock=clock, connection=StubPort(reads))
+        station.open()
+        return station
+    return make
+
+
+def test_line(station):
+    s = station([b'B 29530 338141 366 1010\r\n'])
+    assert s.get_readings() == 'B 29530 338141 366 1010'
+    assert s.arrival is not None
+
+
+def test_timeout(station):
+    s = station([b''])
+    assert s.get_readings() == ''
+    assert s.read_timeouts == 1
+    assert s.arrival is None
+
+
+def test_partial_line_is_kept_over_a_timeout(station):
+    s = station([b'B 29530 338141 366 1010', b'', b' 60 37\r\n'])
+    assert s.get_readings() == ''
+    assert s.get_readings() == ''
+    assert s.read_timeouts == 1
+    assert s.partial == 'B 29530 338141 366 1010'
+    assert s.get_readings() == 'B 29530 338141 366 1010 60 37'
+    assert s.partial == ''
+
+
+def test_partial_line_is_dropped(station):
+    reads = [b'B 29530 338141 366 1010'] + \
+        [b''] * Meteostick.MAX_PARTIAL_TIMEOUTS + [b'B 29531 338141\r\n']
+    s = station(reads)
+    for _ in range(Meteostick.MAX_PARTIAL_TIMEOUTS + 1):
+        assert s.get_readings() == ''
+    assert s.partial == ''
+    assert s.get_readings() == 'B 29531 338141'
+
+
+def test_partial_line_in_pieces(station):
+    s = station([b'B 29530', b' 338141', b'', b' 366\r\n'])
+    for _ in range(3):
+        assert s.get_readings() == ''
+    assert s.get_readings() == 'B 29530 338141 366'
@@ -0,0 +1,95 @@
+# tests of the rf tuner of the meteostick driver
+# Distributed under the terms of the GNU Public License (GPLv3)
+
+import pytest
+
+from user.meteostick import RFTuner
+
+INTERVAL = 600
+
+
+class Window(object):
+    """Feeds the windows of a tuner that started at time 0."""
+
+    def __init__(self, tuner, rfs=90):
+        self.tuner = tuner
+        self.rfs = rfs
+        self.now = 0
+        self.crc_errors = 0
+        assert tuner.step(self.now, self.rfs, self.crc_errors) is None
+
+    def run(self, frames=30, signal=-80, missed=0, crc_errors=0, ch=1):
+        for i in range(frames):
+            self.tuner.update(ch, signal, missed if i == 0 else 0)
+        self.crc_errors += crc_errors
+        self.now += INTERVAL
+        new = self.tuner.step(self.now, self.rfs, self.crc_errors)
+        if new is not None:
+            self.rfs = new
+        return new
+
+
+def test_invalid_bounds():
+    with pytest.raises(ValueError):
+        RFTuner(90, 80)
+
+
+def test_no_change_within_a_window():
+    tuner = RFTuner(60, 100, interval=INTERVAL)
+    tuner.step(0, 90, 0)
+    tuner.update(1, -89, 5)
+    assert tuner.step(INTERVAL - 1, 90, 0) is None
+
+
+def test_too_few_frames():
+    w = Window(RFTuner(60, 100, interval=INTERVAL))
+    assert w.run(frames=RFTuner.MIN_FRAMES - 1, signal=-89, missed=5) is None
+
+
+def test_raise_on_missed_frames_of_a_weak_channel():
+    w = Window(RFTuner(60, 100, interval=INTERVAL))
+    # a strong channel that missed frames is not helped by a raise
+    assert w.run(signal=-80, missed=5) is None
+    assert w.run(signal=-88, missed=5) == 90 + RFTuner.STEP
+
+
+def test_raise_is_reverted_without_improvement():
+    tuner = RFTuner(60, 100, interval=INTERVAL)
+    w = Window(tuner)
+    assert w.run(signal=-88, missed=5) == 92
+    assert w.run(frames=30, signal=-88, missed=5) == 90
+    assert tuner.changes == 2
+    # no raise is tried for HOLD windows
+    for _ in range(RFTuner.HOLD):
+        assert w.run(signal=-88, missed=5) is None
+    assert w.run(signal=-88, missed=5) == 92
+
+
+def test_raise_is_kept_with_improvement():
+    w = Window(RFTuner(60, 100, interval=INTERVAL))
+    assert w.run(signal=-88, missed=5) == 92
+    assert w.run(frames=40, signal=-90) is None
+    assert w.rfs == 92
+    # the next raise is judged against the improved rate
+    assert w.run(frames=40, signal=-90, missed=5) == 94
+    assert w.run(frames=40, signal=-90, missed=5) == 92
+
+
+def test_lower_on_crc_errors():
+    w = Window(RFTuner(60, 100, interval=INTERVAL))
+    # no raise while the crc error rate is high
+    assert w.run(frames=30, signal=-80, missed=5, crc_errors=10) == 88
+
+
+def test_lower_stops_above_the_weakest_signal():
+    w = Window(RFTuner(60, 100, interval=INTERVAL), rfs=89)
+    # 87 would be below the weakest signal plus the margin
+    assert w.run(frames=30, signal=-85, crc_errors=10) is None
+
+
+def test_bounds():
+    w = Window(RFTuner(60, 91, interval=INTERVAL))
+    assert w.run(signal=-88, missed=5) == 91
+    w = Window(RFTuner(91, 100, interval=INTERVAL), rfs=91)
+    assert w.run(frames=30, signal=-60, crc_errors=10) is None
+    assert w.tuner.changes == 0
@@ -0,0 +1,129 @@
+# tests of the loop ring file of the meteostick driver
+# Distributed under the terms of the GNU Public License (GPLv3)
+
+import threading
+
+import pytest
+
+from user.meteostick import LoopRing, LoopRingReader
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'loop.ring')
+
+
+def fill(ring, first, last):
+    for i in range(first, last):
+        ring.append({'dateTime': i, 'a': i, 'b': i})
+
+
+def test_records(path):
+    ring = LoopRing(path, ['a', 'b'], capacity=10)
+    ring.append({'dateTime': 100, 'a': 1.5, 'b': None})
+    ring.append({'dateTime': 101, 'a': 2.5, 'c': 3.0})
+    reader = LoopRingReader(path)
+    assert reader.fields == ['a', 'b']
+    assert reader.latest() == [{'dateTime': 100, 'a': 1.5},
+                               {'dateTime': 101, 'a': 2.5}]
+    reader.close()
+    ring.close()
+
+
+def test_wrap_around(path):
+    ring = LoopRing(path, ['a', 'b'], capacity=10)
+    fill(ring, 0, 25)
+    reader = LoopRingReader(path)
+    assert [r['dateTime'] for r in reader.latest()] == list(range(15, 25))
+    assert [r['dateTime'] for r in reader.latest(max_records=3)] == \
+        [22, 23, 24]
+    assert [r['dateTime'] for r in reader.latest(seconds=2)] == [22, 23, 24]
+    reader.close()
+    ring.close()
+
+
+def test_reopen(path):
+    ring = LoopRing(path, ['a', 'b'], capacity=10)
+    fill(ring, 0, 5)
+    ring.close()
+    ring = LoopRing(path, ['a', 'b'], capacity=10)
+    assert ring.write_count == 5
+    fill(ring, 5, 7)
+    ring.close()
+    # a different layout starts a new ring
+    ring = LoopRing(path, ['a'], capacity=10)
+    assert ring.write_count == 0
+    reader = LoopRingReader(path)
+    assert reader.latest() == []
+    reader.close()
+    ring.close()
+
+
+def test_not_a_ring(path):
+    with open(path, 'wb') as f:
+        f.write(b'\0' * 4096)
+    with pytest.raises(ValueError):
+        LoopRingReader(path)
+
+
+def test_slot_being_written(path):
+    ring = LoopRing(path, ['a', 'b'], capacity=10)
+    fill(ring, 0, 10)
+    # the writer invalidated the slot of record 2 to overwrite it
+    offset = ring.header_size + 2 * ring.record.size
+    LoopRing.SEQ.pack_into(ring.mm, offset, 0)
+    reader = LoopRingReader(path)
+    assert [r['dateTime'] for r in reader.latest()] == list(range(3, 10))
+    reader.close()
+    ring.close()
+
+
+def test_record_overwritten_while_copied(path):
+    ring = LoopRing(path, ['a', 'b'], capacity=10)
+    fill(ring, 0, 10)
+    reader = LoopRingReader(path)
+
+    class Racing(object):
+        # the writer overwrites record 4 while the reader copies it
+        size = reader.record.size
+
+        def unpack_from(self, mm, offset):
+            values = record.unpack_from(mm, offset)
+            if values[1] == 4:
+                fill(ring, 10, 15)
+            return values
+
+    record = reader.record
+    reader.record = Racing()
+    assert [r['dateTime'] for r in reader.latest()] == list(range(5, 10))
+    reader.close()
+    ring.close()
+
+
+def test_concurrent_reads_are_consistent(path):
+    ring = LoopRing(path, ['a', 'b'], capacity=50)
+    reader = LoopRingReader(path)
+    done = threading.Event()
+
+    def write():
+        i = 0
+        while not done.is_set():
+            ring.append({'dateTime': i, 'a': i, 'b': i})
+            i += 1
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        for _ in range(2000):
+            records = reader.latest()
+            for r in records:
+                assert r['a'] == r['b'] == r['dateTime']
+            # a torn record ends the read, so the records are consecutive
+            times = [int(r['dateTime']) for r in records]
+            if times:
+                assert times == list(range(times[0], times[0] + len(times)))
+    finally:
+        done.set()
+        writer.join()
+    reader.close()
+    ring.close()
@@ -0,0 +1,137 @@
+# soak test of the meteostick driver
+# Distributed under the terms of the GNU Public License (GPLv3)
+"""Run the driver over many frames in virtual time and check that memory,
+cpu per frame and latency stay flat.
+
+The number of frames is set with METEOSTICK_SOAK_FRAMES and the frames
+between samples with METEOSTICK_SOAK_SAMPLE_EVERY; a capture is replayed,
+over and over, instead of synthetic frames with METEOSTICK_SOAK_REPLAY.
+For a real soak run millions of frames, for example
+
+  METEOSTICK_SOAK_FRAMES=5000000 METEOSTICK_SOAK_SAMPLE_EVERY=100000 \\
+    python -m pytest -s tests/test_soak.py
+"""
+
+import itertools
+import os
+
+from user.meteostick import (DRIVER_NAME, Histogram, MeteostickDriver,
+                             _monotonic)
+
+from tests.replay import EndOfReplay, synthetic_lines
+
+FRAMES = int(os.environ.get('METEOSTICK_SOAK_FRAMES', 20000))
+SAMPLE_EVERY = int(os.environ.get('METEOSTICK_SOAK_SAMPLE_EVERY', 2000))
+REPLAY = os.environ.get('METEOSTICK_SOAK_REPLAY')
+
+
+def rss():
+    # resident set size in bytes
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class SoakTest(object):
+    """Every sample_every frames the resident memory, the memory traced by
+    tracemalloc, the cpu time per frame and the mean latency from reading
+    a line to yielding its packet are sampled.  After the first sample,
+    which includes the warm-up, the mean of the last third of the samples
+    is compared with that of the first third; a growth beyond the
+    tolerance fails the test and the top growing allocators are shown.
+    """
+    TOLERANCE = 0.25 # relative growth of cpu and latency
+    MEMORY_TOLERANCE = 0.05 # relative growth of memory
+    MIN_MEMORY_GROWTH = 1 << 20 # bytes
+
+    def __init__(self, port, config_dict=None, sample_every=100000,
+                 trace=True):
+        self.port = port
+        self.config_dict = config_dict or {
+            DRIVER_NAME: {'archive_interval': 300}}
+        self.sample_every = sample_every
+        self.trace = trace
+        self.samples = []
+        self.snapshots = []
+
+    def run(self, clock):
+        """Run the driver over all frames of the port.  Returns the list
+        of what grows."""
+        if self.trace:
+            import tracemalloc
+            tracemalloc.start()
+        driver = MeteostickDriver(None, self.config_dict, clock=clock,
+                                  connection=self.port)
+        latency = Histogram()
+        next_sample = self.sample_every
+        cpu0 = sum(os.times()[:2])
+        print("%10s %10s %10s %12s %12s" %
+              ('frames', 'rss kB', 'traced kB', 'cpu us/frame', 'latency us'))
+        try:
+            for _ in driver.genLoopPackets():
+                latency.record(_monotonic() - self.port.read_ts)
+                if self.port.count >= next_sample:
+                    cpu1 = sum(os.times()[:2])
+                    self._sample(self.port.count, cpu1 - cpu0, latency)
+                    cpu0 = cpu1
+                    latency.reset()
+                    next_sample += self.sample_every
+        except EndOfReplay:
+            pass
+        finally:
+            driver.closePort()
+            if self.trace:
+                tracemalloc.stop()
+        return self.growth()
+
+    def _sample(self, count, cpu, latency):
+        traced = 0
+        if self.trace:
+            import tracemalloc
+            traced = tracemalloc.get_traced_memory()[0]
+            if len(self.snapshots) < 2:
+                self.snapshots.append(tracemalloc.take_snapshot())
+            else:
+                self.snapshots[1] = tracemalloc.take_snapshot()
+        sample = {'rss': rss(), 'traced': traced,
+                  'cpu': cpu / self.sample_every,
+                  'latency': latency.total / latency.cnt if latency.cnt else 0.0}
+        self.samples.append(sample)
+        print("%10d %10d %10d %12.1f %12.1f" %
+              (count, sample['rss'] // 1024, traced // 1024,
+               1000000.0 * sample['cpu'], 1000000.0 * sample['latency']))
+
+    def growth(self):
+        samples = self.samples[1:] # skip the warm-up
+        if len(samples) < 3:
+            print("not enough samples to check for growth")
+            return []
+        n = len(samples) // 3
+        grows = []
+        for key, tolerance, minimum in [
+                ('rss', self.MEMORY_TOLERANCE, self.MIN_MEMORY_GROWTH),
+                ('traced', self.MEMORY_TOLERANCE, self.MIN_MEMORY_GROWTH),
+                ('cpu', self.TOLERANCE, 0.0),
+                ('latency', self.TOLERANCE, 0.0)]:
+            first = sum(s[key] for s in samples[:n]) / n
+            last = sum(s[key] for s in samples[-n:]) / n
+            if last - first > max(tolerance * first, minimum):
+                grows.append("%s grows from %s to %s" % (key, first, last))
+        if self.trace and len(self.snapshots) == 2:
+            print("top growing allocations:")
+            for stat in self.snapshots[1].compare_to(self.snapshots[0],
+                                                     'lineno')[:5]:
+                print("  %s" % stat)
+        return grows
+
+
+def test_soak(clock, replay_port):
+    lines = None
+    if REPLAY:
+        with open(REPLAY) as f:
+            lines = itertools.cycle([l for l in f if l.strip()])
+    test = SoakTest(replay_port(FRAMES, lines), sample_every=SAMPLE_EVERY)
+    assert test.run(clock) == []